@@ -1,6 +1,9 @@
 from abc import ABC, abstractmethod
 from objects import *
+from weakref import WeakKeyDictionary
+import geo
 import heapq
+from array import array
 
 class Algorithm(ABC):
     """
@@ -21,57 +24,226 @@ class Algorithm(ABC):
 class Dijkstra(Algorithm):
     """
     Class for the normal Dijkstra Algorithm.
-    Queue takes in any implementation of a PriorityQueue.
+    Queue takes in any implementation of a PriorityQueue, an IndexedMinHeap is used if none is given.
     At the moment we have:
         1) List-based priority queue 
         2) Binary heap
-        3) BST
+        3) Indexed binary heap
+        4) BST
+
+    The queue only ever holds nodes that have been reached. When a shorter distance to a node is found
+    the queue's decreaseKey is called. The IndexedMinHeap updates the entry in place; the other queues
+    push it again and the older, larger entry is skipped when it is popped (lazy deletion).
+    The search stops as soon as the destination is popped from the queue. If destination is None,
+    the search runs until every reachable node is settled and edgeTo holds the full shortest-path tree.
+    All search state lives on the instance, so two searches never share anything.
+
+    On a CompactGraph the search runs over the dense node indexes and the CSR arrays instead of adj(), so
+    no Edge objects are created while searching (see searchCompact).
+
+    With reverse=True the search follows edges backwards (graph.radj), so distance[node] is the distance
+    from node to source and edgeTo[node] is the edge leaving node on its way to source.
     """
     name = "Classic Dijkstra Algorithm"
-    distance = {}
-    edgeTo = {}
-    queue = MinHeap()
 
-    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None) -> None:
-        super().__init__(source, destination, graph, queue)
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None, reverse: bool = False) -> None:
+        super().__init__(source, destination, graph, queue if queue is not None else IndexedMinHeap())
         
-        for node in self.graph.adjacency_list:
-            self.distance[node] = float('inf')
-            self.edgeTo[node] = None
-            self.queue.push(PQItem(self.source.distanceTo(node), node))
-                
-        self.distance[self.source] = 0.0
+        self.reverse = reverse
+
+        self.distance = {self.source: 0.0}
+        self.edgeTo = {self.source: None}
+        self.settled = set()
+        
+        if isinstance(self.graph, CompactGraph) and self.graph.indexOf(self.source) is not None:
+            self.searchCompact(self.graph.indexOf(self.source))
+        else:
+            self.search()
+
+    def search(self) -> None:
+        """
+        Run the search over the Node and Edge objects returned by graph.adj or graph.radj.
+        """
+        self.queue.push(PQItem(self.heuristic(self.source), self.source))
                             
         while not self.queue.isEmpty():
             current_node = self.queue.pop().element
             
-            for edge in self.graph.adj(current_node):
-                    distance = self.distance[current_node] + edge.distance
-                    
-                    if edge.destination not in self.distance:
-                        self.distance[edge.destination] = distance
-                        self.edgeTo[edge.destination] = edge
-                        
-                    else:
-                        if distance < self.distance[edge.destination]:
-                            self.distance[edge.destination] = distance
-                            self.edgeTo[edge.destination] = edge
+            # stale entry left behind by a later, shorter push
+            if current_node in self.settled:
+                continue
+            
+            self.settled.add(current_node)
+            
+            if self.finished(current_node):
+                break
+            
+            for edge in (self.graph.radj(current_node) if self.reverse else self.graph.adj(current_node)):
+                next_node = edge.source if self.reverse else edge.destination
+                distance = self.distance[current_node] + edge.distance
+                
+                if not self.allowed(edge, distance):
+                    continue
+                
+                if distance < self.distance.get(next_node, float('inf')):
+                    self.distance[next_node] = distance
+                    self.edgeTo[next_node] = edge
+                    self.queue.decreaseKey(next_node, distance + self.heuristic(next_node))
+
+    def searchCompact(self, source: int) -> None:
+        """
+        Run the same search over the arrays of a CompactGraph, with dense node indexes in place of Node objects
+        and the position of an edge in the arrays in place of Edge objects. The hooks are still called with
+        Node objects, and an Edge object is only created for allowed when a subclass overrides it.
+        distance, edgeTo and settled are filled in with Node and Edge objects once the search ends, so they
+        read the same as after a search over a Graph.
+
+        Arguments:
+            source -- dense integer index of the source node
+        """
+        graph = self.graph
+        nodes, distances = graph.nodes, graph.distances
+        check = type(self).allowed is not Dijkstra.allowed
+        inf = float('inf')
+
+        if self.reverse:
+            offsets, neighbours, positions = graph.roffsets, graph.rsources, graph.rpositions
+        else:
+            offsets, neighbours, positions = graph.offsets, graph.targets, None
+
+        # edgeTo holds (index of the edge's source, position of the edge) until the search ends
+        distance = {source: 0.0}
+        edgeTo = {source: None}
+        settled = set()
+
+        self.queue.push(PQItem(self.heuristic(nodes[source]), source))
+
+        while not self.queue.isEmpty():
+            current = self.queue.pop().element
+
+            if current in settled:
+                continue
+
+            settled.add(current)
+
+            if self.finished(nodes[current]):
+                break
+
+            for slot in range(offsets[current], offsets[current + 1]):
+                next = neighbours[slot]
+                position = slot if positions is None else positions[slot]
+                next_distance = distance[current] + distances[position]
+                edge = (next, position) if self.reverse else (current, position)
+
+                if check and not self.allowed(graph.edge(*edge), next_distance):
+                    continue
+
+                if next_distance < distance.get(next, inf):
+                    distance[next] = next_distance
+                    edgeTo[next] = edge
+                    self.queue.decreaseKey(next, next_distance + self.heuristic(nodes[next]))
+
+        self.distance = {nodes[index]: value for index, value in distance.items()}
+        self.edgeTo = {nodes[index]: graph.edge(*edge) if edge is not None else None for index, edge in edgeTo.items()}
+        self.settled = set(nodes[index] for index in settled)
+
+    def heuristic(self, node) -> float:
+        """
+        Estimate of the remaining distance from node to the destination, added to the queue priority.
+        Plain Dijkstra has no estimate; subclasses such as AStar override this.
+        """
+        return 0.0
+    
+    def finished(self, node) -> bool:
+        """
+        Called with every node as it is settled, the search stops when this returns True.
+        """
+        return node == self.destination
+    
+    def allowed(self, edge, distance) -> bool:
+        """
+        Called before relaxing an edge with the distance it would give its end node; the edge is skipped if this returns False.
+        """
+        return True
  
     def getPath(self) -> list:
-        if not self.edgeTo[self.destination]:
+        return self.pathTo(self.destination)
+    
+    def pathTo(self, destination) -> list:
+        """
+        Returns the route to any node the search has settled, by walking edgeTo back to the source.
+        After a search with destination None this answers every reachable node from the one search.
+
+        Arguments:
+            destination -- Node object to get the route to
+
+        Returns:
+            List of Edge objects, last edge first, empty if the node was not reached
+        """
+        if destination not in self.settled or not self.edgeTo.get(destination):
             return []
         
         path = []
-        edge = self.edgeTo[self.destination]
+        edge = self.edgeTo[destination]
         
         while edge is not None:
             path.append(edge)
-            edge = self.edgeTo[edge.source]
-            
-        return path
+            edge = self.edgeTo[edge.destination if self.reverse else edge.source]
+        
+        # a reverse search walks the route in travel order, flip it to match the forward search
+        return path[::-1] if self.reverse else path
         
             
     
+class OneToManyDijkstra(Dijkstra):
+    """
+    Dijkstra from one source to a set of destinations. The search stops as soon as every destination
+    has been settled, or the reachable part of the graph runs out, so one search answers all of them.
+    destination is left as None; use distance and pathTo for each node in targets.
+    """
+    name = "One-to-Many Dijkstra Algorithm"
+
+    def __init__(self, source: Node, targets: list, graph: Graph, queue: PriorityQueue = None) -> None:
+        self.targets = list(targets)
+        self.remaining = set(self.targets)
+        super().__init__(source, None, graph, queue)
+
+    def finished(self, node) -> bool:
+        self.remaining.discard(node)
+        return not self.remaining
+    
+    
+class BoundedDijkstra(Dijkstra):
+    """
+    Dijkstra that only explores within a distance budget from the source, optionally using only some edge types.
+    Edges that would take a node past max_distance are never relaxed, so the search ends by itself once the
+    frontier reaches the budget and settled holds exactly the nodes reachable within it.
+    """
+    name = "Bounded Dijkstra Algorithm"
+
+    def __init__(self, source: Node, max_distance: float, graph: Graph, queue: PriorityQueue = None, types=None) -> None:
+        """
+        Arguments:
+            source       -- Node object to search from
+            max_distance -- largest distance from the source to explore, in kilometers
+            graph        -- Graph or CompactGraph object
+            queue        -- PriorityQueue object
+            types        -- edge types to use, for example {"Walk", "Bus"}; None uses every edge
+        """
+        self.max_distance = max_distance
+        self.types = set(types) if types is not None else None
+        super().__init__(source, None, graph, queue)
+
+    def allowed(self, edge, distance) -> bool:
+        return distance <= self.max_distance and (self.types is None or edge.type in self.types)
+
+    def reachable(self) -> list:
+        """
+        Returns every node within the budget as (Node, distance) tuples, nearest first
+        """
+        return sorted(((node, self.distance[node]) for node in self.settled), key=lambda pair: pair[1])
+    
+    
 class DijkstraNoPQ(Algorithm):
     
     name = "Dijkstra Without Priority Queue"
@@ -98,14 +270,13 @@ class DijkstraNoPQ(Algorithm):
             for edge in self.graph.adj(current_node):
                 curr_distance: float = edge.distance + self.path[current_node].distance
 
-                if edge.destination not in self.path:
-                    self.path[edge.destination] = edge
-                    self.path[edge.destination].distance = curr_distance
-
-                else:
-                    if self.path[edge.destination].distance > curr_distance:
-                        self.path[edge.destination] = edge
-                        self.path[edge.destination].distance = curr_distance
+                # store a copy carrying the running distance, the edge itself belongs to the shared graph
+                if (edge.destination not in self.path) or (self.path[edge.destination].distance > curr_distance):
+                    self.path[edge.destination] = Edge(source=edge.source,
+                                                       destination=edge.destination,
+                                                       distance=curr_distance,
+                                                       bus_service=edge.bus_service,
+                                                       type=edge.type)
 
             next_edges = {node: self.path[node] for node in self.path if node not in seen}
 
@@ -126,59 +297,196 @@ class DijkstraNoPQ(Algorithm):
     
    
     
-class AStar(Algorithm):
-    
+class AStar(Dijkstra):
+    """
+    A-Star search. Runs the same search as Dijkstra, with the real path cost accumulated from the edges
+    (g), but orders the queue by g plus the straight-line distance from the node to the destination (h),
+    so nodes heading away from the destination are expanded last or not at all.
+
+    The edge distances in our data are sometimes shorter than the straight-line distance between their
+    nodes (rounding, and bus routes measured differently), which would make the raw straight-line
+    distance overestimate. h is therefore scaled down by the smallest edge distance to straight-line
+    distance ratio in the graph, which keeps it a lower bound and the returned path the shortest one.
+    """
     name = "A-Star Algorithm"
-    visited = []
-    path = {}
+    scales = WeakKeyDictionary()
     
-    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None) -> None:
+    # edges measured per vectorized call by admissibleScale
+    BATCH = 65536
+    
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None, scale: float = None) -> None:
+        self.scale = scale if scale is not None else AStar.admissibleScale(graph)
         super().__init__(source, destination, graph, queue)
         
-        # Push into the source node into queue with F-score = 0
-        self.queue.push(PQItem(0, self.source))
+    def heuristic(self, node) -> float:
+        if self.destination is None:
+            return 0.0
         
-        while not self.queue.isEmpty():
-            
-            # Retrieve the Node with the lowest F-score
-            current_node = self.queue.pop().element
-            
-            # Mark it as visited
-            self.visited_nodes.append(current_node)
-            
-            # If we found our destination, return
-            if (current_node == self.destination):
-                return
+        return self.scale * node.distanceTo(self.destination, exact=True)
+    
+    @staticmethod
+    def admissibleScale(graph) -> float:
+        """
+        Returns the largest factor that the straight-line distance can be multiplied by without ever
+        exceeding the real distance of an edge in the graph. Computed once per graph object.
+        
+        Arguments:
+            graph -- Graph or CompactGraph object
+        
+        Returns:
+            float between 0 and 1
+        """
+        if graph not in AStar.scales:
+            scale = 1.0
+            edges = []
             
-            # Enumerate through all the adjacent nodes
-            for edge in self.graph.adj(current_node):
-                next_node = edge.destination
-                
-                # ignore any visited nodes
-                if next_node in self.visited:
-                    continue
+            for node in graph.vertices():
+                edges.extend(graph.adj(node))
                 
-                if self.queue.contains(next_node):
-                    temp_g = self.__g(current_node) + edge.distance
-               
-                
-                if self.queue.contains(next_node) and self.__g(next_node) < curr_cost:
-                    continue
-                
-                if next_node in self.visited_nodes and self.__g(next_node) < curr_cost:
-                    continue
-                                   
-    def getPath(self) -> list:
-        return self.path
-                   
-    
-    def __g(self, node):
-        return self.source.distanceTo(node)
+                # a batch of edges at a time, so a LazyGraph never has to be held in memory all at once
+                if len(edges) >= AStar.BATCH:
+                    scale = min(scale, AStar.straightRatio(edges))
+                    edges = []
+            
+            AStar.scales[graph] = float(min(scale, AStar.straightRatio(edges)))
+        
+        return AStar.scales[graph]
     
-    def __h(self, node):
-        return self.destination.distanceTo(node)
+    @staticmethod
+    def straightRatio(edges) -> float:
+        """
+        Returns the smallest ratio of edge distance to straight-line distance over a list of edges, at most 1.0
+        """
+        scale = 1.0
+        sources = geo.coordinates([edge.source for edge in edges])
+        destinations = geo.coordinates([edge.destination for edge in edges])
+        
+        # straight-line length of every edge in one vectorized call
+        for edge, straight in zip(edges, geo.pairwise(sources[0], sources[1], destinations[0], destinations[1])):
+            if straight > 0:
+                scale = min(scale, edge.distance / straight)
+        
+        return scale
                         
 
+class BidirectionalDijkstra(Algorithm):
+    """
+    Point-to-point Dijkstra that searches forwards from the source and backwards from the destination
+    at the same time. The backward search follows the reverse adjacency list (graph.radj), because our
+    edges are directed. Each round expands the side whose queue has the smaller minimum.
+
+    Whenever an edge reaches a node already labelled by the other side, the combined distance is a
+    candidate route and the best one is kept. The search stops as soon as the two queue minimums add up
+    to at least the best candidate, at which point no shorter route can exist. Each side only has to
+    cover about half the distance, so far fewer nodes are settled on long trips.
+
+    Index 0 of distance, edgeTo, settled and queues belongs to the forward search and index 1 to the backward one.
+    """
+    name = "Bidirectional Dijkstra Algorithm"
+
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None) -> None:
+        super().__init__(source, destination, graph, queue if queue is not None else IndexedMinHeap())
+
+        self.distance = [{self.source: 0.0}, {self.destination: 0.0}]
+        self.edgeTo = [{self.source: None}, {self.destination: None}]
+        self.settled = [set(), set()]
+        self.queues = [self.queue, type(self.queue)()]
+
+        self.best = 0.0 if self.source == self.destination else float('inf')
+        self.meeting = self.source if self.source == self.destination else None
+
+        self.queues[0].push(PQItem(self.potential(self.source, 0), self.source))
+        self.queues[1].push(PQItem(self.potential(self.destination, 1), self.destination))
+
+        while not self.queues[0].isEmpty() and not self.queues[1].isEmpty():
+            forward_min, backward_min = self.queues[0].getMin().priority, self.queues[1].getMin().priority
+
+            # standard stopping criterion, nothing left in either queue can improve on the best route
+            if forward_min + backward_min >= self.best:
+                break
+
+            side = 0 if forward_min <= backward_min else 1
+            current_node = self.queues[side].pop().element
+
+            if current_node in self.settled[side]:
+                continue
+
+            self.settled[side].add(current_node)
+            self.expand(current_node, side)
+
+    def expand(self, current_node, side: int) -> None:
+        """
+        Relax every edge leaving current_node in the direction of the given side.
+
+        Arguments:
+            current_node -- node that was just settled
+            side         -- 0 for the forward search, 1 for the backward search
+        """
+        distance, other = self.distance[side], self.distance[1 - side]
+        edges = self.graph.adj(current_node) if side == 0 else self.graph.radj(current_node)
+
+        for edge in edges:
+            next_node = edge.destination if side == 0 else edge.source
+            next_distance = distance[current_node] + edge.distance
+
+            if next_distance < distance.get(next_node, float('inf')):
+                distance[next_node] = next_distance
+                self.edgeTo[side][next_node] = edge
+                self.queues[side].decreaseKey(next_node, next_distance + self.potential(next_node, side))
+
+                if next_node in other and next_distance + other[next_node] < self.best:
+                    self.best = next_distance + other[next_node]
+                    self.meeting = next_node
+
+    def potential(self, node, side: int) -> float:
+        """
+        Added to the queue priority of a node on the given side. Plain bidirectional Dijkstra has none;
+        BidirectionalAStar overrides this. The forward and backward potentials must add up to zero for
+        the stopping criterion to stay valid.
+        """
+        return 0.0
+
+    def getPath(self) -> list:
+        if self.meeting is None or self.source == self.destination:
+            return []
+
+        # edges from the meeting node back to the source, already in the same order Dijkstra returns them
+        prefix = []
+        edge = self.edgeTo[0][self.meeting]
+
+        while edge is not None:
+            prefix.append(edge)
+            edge = self.edgeTo[0][edge.source]
+
+        # edges from the meeting node on to the destination
+        suffix = []
+        edge = self.edgeTo[1][self.meeting]
+
+        while edge is not None:
+            suffix.append(edge)
+            edge = self.edgeTo[1][edge.destination]
+
+        return suffix[::-1] + prefix
+
+
+class BidirectionalAStar(BidirectionalDijkstra):
+    """
+    Bidirectional search guided by the straight-line distance on both sides.
+    Uses the average of the two A-Star estimates, (h_destination(v) - h_source(v)) / 2 forwards and its
+    negation backwards, so both sides see consistent edge weights and BidirectionalDijkstra's stopping
+    criterion still returns the shortest route. Estimates are scaled the same way as AStar's.
+    """
+    name = "Bidirectional A-Star Algorithm"
+
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None, scale: float = None) -> None:
+        self.scale = scale if scale is not None else AStar.admissibleScale(graph)
+        super().__init__(source, destination, graph, queue)
+
+    def potential(self, node, side: int) -> float:
+        estimate = self.scale * (node.distanceTo(self.destination, exact=True) - node.distanceTo(self.source, exact=True)) / 2
+        return estimate if side == 0 else -estimate
+
+
 class IanAStar(Algorithm):
     """
     For our search algorithm we went with the a*star algorithm as the added heuristic will allow us to find our shortest path in a
@@ -188,57 +496,456 @@ class IanAStar(Algorithm):
     This brings us with two benefits; one is that it mimics the reality of the situation where transferring busses is time consuming and undesirable.
     The second is that we will not look at every path, but only those that contains the smaller number of transfers that we want.
     This means less paths traversed and a faster search time.
+
+    The search runs over (node, bus service) states, since arriving at a stop on a different service changes what the next
+    edge costs. Each state only remembers the state and edge it was reached from, and the route is rebuilt from those parent
+    pointers once the destination is reached, so getPath returns Edge objects in the same order as Dijkstra.
+    The scaled straight-line distance from AStar is used to guide the search; every edge costs at least its distance, so it
+    never overestimates.
+    On a CompactGraph the states hold dense node indexes and the search reads the CSR arrays, like Dijkstra.searchCompact.
     """
     name = "Ian's A-Star Algorithm"
+    transfer_penalty = 10
+    edge_penalty = 0.5
     
-    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None) -> None:
-        self.source = source
-        self.destination = destination
-        self.graph = graph
-        self.queue = []
-    
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None, scale: float = None) -> None:
+        super().__init__(source, destination, graph, queue if queue is not None else IndexedMinHeap())
+        
+        self.scale = scale if scale is not None else AStar.admissibleScale(graph)
+        
+        if isinstance(self.graph, CompactGraph) and self.graph.indexOf(self.source) is not None:
+            self.searchCompact(self.graph.indexOf(self.source))
+        else:
+            self.search()
+            
+    def search(self) -> None:
+        """
+        Run the search over the Node and Edge objects returned by graph.adj.
+        """
+        start = (self.source, None)
+        self.cost = {start: 0.0}
+        self.distance = {start: 0.0}
+        self.transfers = {start: 0}
+        self.parent = {start: None}
+        self.settled = set()
+        self.end = None
+        
+        self.queue.push(PQItem(self.heuristic(self.source), start))
+        
+        while not self.queue.isEmpty():
+            state = self.queue.pop().element
+            
+            if state in self.settled:
+                continue
+            
+            self.settled.add(state)
+            (node, curr_service) = state
+            
+            # path found
+            if node == self.destination:
+                self.end = state
+                break
+            
+            for edge in self.graph.adj(node):
+                next_state = (edge.destination, edge.bus_service)
+                new_cost = self.cost[state] + edge.distance + self.edge_penalty
+                new_transfers = self.transfers[state]
+                
+                if curr_service != edge.bus_service:
+                    new_cost += self.transfer_penalty
+                    new_transfers += 1
+                    
+                if new_cost < self.cost.get(next_state, float('inf')):
+                    self.cost[next_state] = new_cost
+                    self.distance[next_state] = self.distance[state] + edge.distance
+                    self.transfers[next_state] = new_transfers
+                    self.parent[next_state] = (state, edge)
+                    self.queue.decreaseKey(next_state, new_cost + self.heuristic(edge.destination))
+                    
+    def searchCompact(self, source: int) -> None:
+        """
+        Run the same search over the arrays of a CompactGraph, with (node index, bus service) states and the position
+        of an edge in the arrays in place of Edge objects. The state dicts are filled in with Node and Edge objects once
+        the search ends.
+
+        Arguments:
+            source -- dense integer index of the source node
+        """
+        graph = self.graph
+        nodes, offsets, targets, distances, codes = graph.nodes, graph.offsets, graph.targets, graph.distances, graph.codes
+        services = [bus_service for type, bus_service in graph.services]
+        destination = graph.indexOf(self.destination)
+        inf = float('inf')
+        
+        start = (source, None)
+        cost = {start: 0.0}
+        distance = {start: 0.0}
+        transfers = {start: 0}
+        parent = {start: None}
+        settled = set()
+        end = None
+        
+        self.queue.push(PQItem(self.heuristic(nodes[source]), start))
+        
+        while not self.queue.isEmpty():
+            state = self.queue.pop().element
+            
+            if state in settled:
+                continue
+            
+            settled.add(state)
+            (node, curr_service) = state
+            
+            # path found
+            if node == destination:
+                end = state
+                break
+            
+            for position in range(offsets[node], offsets[node + 1]):
+                bus_service = services[codes[position]]
+                next_state = (targets[position], bus_service)
+                new_cost = cost[state] + distances[position] + self.edge_penalty
+                new_transfers = transfers[state]
+                
+                if curr_service != bus_service:
+                    new_cost += self.transfer_penalty
+                    new_transfers += 1
+                    
+                if new_cost < cost.get(next_state, inf):
+                    cost[next_state] = new_cost
+                    distance[next_state] = distance[state] + distances[position]
+                    transfers[next_state] = new_transfers
+                    parent[next_state] = (state, position)
+                    self.queue.decreaseKey(next_state, new_cost + self.heuristic(nodes[targets[position]]))
+        
+        def convert(state):
+            return (nodes[state[0]], state[1])
+        
+        self.cost = {convert(state): value for state, value in cost.items()}
+        self.distance = {convert(state): value for state, value in distance.items()}
+        self.transfers = {convert(state): value for state, value in transfers.items()}
+        self.parent = {convert(state): (convert(link[0]), graph.edge(link[0][0], link[1])) if link is not None else None
+                       for state, link in parent.items()}
+        self.settled = set(convert(state) for state in settled)
+        self.end = convert(end) if end is not None else None
+                    
+    def heuristic(self, node) -> float:
+        return self.scale * node.distanceTo(self.destination, exact=True)
     
     def getPath(self) -> list:
-        seen = set()
-        # maintain a queue of paths
-        queue = []
-        # push the first path into the queue
-        heapq.heappush(queue, (0, 0, 0, [(self.source.id, None)]))
-        while queue:
-            # get the first path from the queue
-            (curr_cost, curr_distance, curr_transfers, path) = heapq.heappop(queue)
+        if self.end is None or self.source == self.destination:
+            return []
+        
+        path = []
+        parent = self.parent[self.end]
+        
+        while parent is not None:
+            state, edge = parent
+            path.append(edge)
+            parent = self.parent[state]
+            
+        return path
 
-            # get the last node from the path
-            (node, curr_service) = path[-1]
 
-            # path found
+class ParetoSearch(Algorithm):
+    """
+    Multi-criteria label-setting search that finds every route worth taking when both total distance and
+    the number of bus/MRT transfers matter, instead of folding transfers into a fixed penalty like IanAStar.
+    A route is kept if no other route is both no longer and has no more transfers (the Pareto frontier).
+
+    A label is one way of arriving at a node: its distance, how many vehicles have been boarded, the vehicle
+    (edge type and bus service) currently being ridden, and the label it came from. Labels are taken from
+    the queue in order of distance, then boardings. A label is dropped as soon as another label at the same
+    node is at least as good on both counts; one riding a different vehicle needs one boarding fewer to
+    count, since staying on is free. Labels that cannot beat a route already found to the destination are
+    dropped too, so the whole frontier comes out of a single search.
+
+    Labels are stored column-wise in flat arrays and lists indexed by label number.
+    """
+    name = "Pareto Distance and Transfers Search"
+    vehicles = ("Bus", "MRT")
+
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None) -> None:
+        super().__init__(source, destination, graph, queue if queue is not None else IndexedMinHeap())
+
+        self.label_distance = array("d")
+        self.label_boardings = array("l")
+        self.label_parent = array("l")
+        self.label_alive = bytearray()
+        self.label_node = []
+        self.label_vehicle = []
+        self.label_edge = []
 
+        self.bags = {}
+        self.frontier = []
+        fewest_transfers = float('inf')
+
+        self.queue.push(PQItem((0.0, 0), self.__label(self.source, 0.0, 0, None, -1, None)))
+
+        while not self.queue.isEmpty():
+            label = self.queue.pop().element
+
+            if not self.label_alive[label]:
+                continue
+
+            node, transfers = self.label_node[label], self.transfers(label)
+
+            # no extension of this label can beat a route already found
+            if transfers >= fewest_transfers:
+                continue
 
             if node == self.destination:
-                return (curr_distance, path)
-            if (node, curr_service) in seen:
+                self.frontier.append(label)
+                fewest_transfers = transfers
                 continue
 
-            seen.add((node, curr_service))
-            # enumerate all adjacent nodes, construct a new path and push it into the queue
             for edge in self.graph.adj(node):
-                (adjacent, service), distance = (edge.destination, edge.bus_service), edge.distance
-                new_path = list(path)
-                new_path.append((adjacent, service))
-                new_distance = curr_distance + distance
-                new_cost = distance + curr_cost
-                new_transfers = curr_transfers
-                if curr_service != service:
-                    new_cost += 10
-                    new_transfers += 1
-                new_cost += 0.5
+                vehicle = (edge.type, edge.bus_service) if edge.type in self.vehicles else None
+                boardings = self.label_boardings[label]
 
-                heapq.heappush(queue, (new_cost, new_distance, new_transfers, new_path))
-                
-        return []
-        
-        
-            
-        
-        
-        
\ No newline at end of file
+                if vehicle is not None and vehicle != self.label_vehicle[label]:
+                    boardings += 1
+
+                distance = self.label_distance[label] + edge.distance
+
+                if self.__dominated(edge.destination, distance, boardings, vehicle):
+                    continue
+
+                next_label = self.__label(edge.destination, distance, boardings, vehicle, label, edge)
+                self.queue.push(PQItem((distance, boardings), next_label))
+
+    def __label(self, node, distance, boardings, vehicle, parent, edge) -> int:
+        """
+        Store a new label and add it to its node's bag.
+
+        Returns:
+            int label number
+        """
+        label = len(self.label_node)
+        self.label_distance.append(distance)
+        self.label_boardings.append(boardings)
+        self.label_parent.append(parent)
+        self.label_alive.append(1)
+        self.label_node.append(node)
+        self.label_vehicle.append(vehicle)
+        self.label_edge.append(edge)
+        self.bags.setdefault(node, []).append(label)
+        return label
+
+    def __dominated(self, node, distance, boardings, vehicle) -> bool:
+        """
+        Check a candidate label against the labels already at the node. Returns True if one of them is at least
+        as good, otherwise marks every label the candidate beats as dead and returns False.
+        """
+        bag = self.bags.get(node, [])
+
+        for label in bag:
+            penalty = 0 if vehicle is None or vehicle == self.label_vehicle[label] else 1
+
+            if self.label_distance[label] <= distance and self.label_boardings[label] + penalty <= boardings:
+                return True
+
+        alive = []
+
+        for label in bag:
+            penalty = 0 if self.label_vehicle[label] is None or self.label_vehicle[label] == vehicle else 1
+
+            if distance <= self.label_distance[label] and boardings + penalty <= self.label_boardings[label]:
+                self.label_alive[label] = 0
+            else:
+                alive.append(label)
+
+        self.bags[node] = alive
+        return False
+
+    @staticmethod
+    def countTransfers(path) -> int:
+        """
+        Returns the number of transfers along a path, counted the same way as the labels: boarding a
+        vehicle other than the one just ridden, after the first.
+
+        Arguments:
+            path -- list of Edge objects in the order returned by getPath
+
+        Returns:
+            int number of transfers
+        """
+        boardings = 0
+        vehicle = None
+
+        # getPath lists the last edge first
+        for edge in reversed(path):
+            current = (edge.type, edge.bus_service) if edge.type in ParetoSearch.vehicles else None
+
+            if current is not None and current != vehicle:
+                boardings += 1
+
+            vehicle = current
+
+        return max(boardings - 1, 0)
+
+    def transfers(self, label: int) -> int:
+        """
+        Returns the number of transfers of a label, one less than the number of vehicles boarded
+        """
+        return max(self.label_boardings[label] - 1, 0)
+
+    def edgesTo(self, label: int) -> list:
+        """
+        Returns the edges leading to a label, in the same order as Dijkstra.getPath
+        """
+        path = []
+
+        while self.label_edge[label] is not None:
+            path.append(self.label_edge[label])
+            label = self.label_parent[label]
+
+        return path
+
+    def getFrontier(self) -> list:
+        """
+        Returns every Pareto-optimal route, shortest first, as a list of dicts with the keys
+        distance, transfers and path (edge list in the same order as Dijkstra.getPath)
+        """
+        if self.source == self.destination:
+            return []
+
+        return [{"distance": self.label_distance[label],
+                 "transfers": self.transfers(label),
+                 "path": self.edgesTo(label)} for label in self.frontier]
+
+    def getPath(self) -> list:
+        """
+        Returns the shortest route on the frontier
+        """
+        frontier = self.getFrontier()
+        return frontier[0]["path"] if frontier else []
+
+
+class RestrictedAStar(Dijkstra):
+    """
+    A-Star search that may not use some edges or pass through some nodes, used for Yen's spur searches.
+    The heuristic is a dict of exact distances to the destination in the unrestricted graph. Taking edges or
+    nodes away can only make routes longer, so those distances stay a consistent lower bound, and nodes
+    missing from the dict cannot reach the destination at all and are never entered.
+    """
+    name = "Restricted A-Star Algorithm"
+
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None,
+                 estimates: dict = None, banned_edges: set = None, banned_nodes: set = None) -> None:
+        """
+        Arguments:
+            estimates    -- dict of Node object to its distance to the destination
+            banned_edges -- set of (source id, destination id) of edges that may not be used
+            banned_nodes -- set of ids of nodes that may not be entered
+        """
+        self.estimates = estimates if estimates is not None else {}
+        self.banned_edges = banned_edges if banned_edges is not None else set()
+        self.banned_nodes = banned_nodes if banned_nodes is not None else set()
+        super().__init__(source, destination, graph, queue)
+
+    def heuristic(self, node) -> float:
+        return self.estimates.get(node, 0.0)
+
+    def allowed(self, edge, distance) -> bool:
+        return (edge.destination in self.estimates and
+                edge.destination.id not in self.banned_nodes and
+                (edge.source.id, edge.destination.id) not in self.banned_edges)
+
+
+class YenKShortest(Algorithm):
+    """
+    Yen's algorithm for the k shortest loopless routes, with Lawler's change that a new route is only
+    branched off (spurred) after the point where it left the route it was derived from, since the earlier
+    branch points were already tried for that root prefix. Each spur search is a RestrictedAStar guided by
+    the exact distances to the destination from one reverse Dijkstra, computed once per query and shared by
+    every spur search. The root prefix costs are carried along instead of being recomputed.
+
+    getPaths returns the routes shortest first, each in the same order as Dijkstra.getPath.
+    """
+    name = "Yen's K Shortest Paths"
+
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None, k: int = 3) -> None:
+        super().__init__(source, destination, graph, queue)
+
+        self.k = k
+        self.routes = []
+
+        if self.source == self.destination or k < 1:
+            return
+
+        # one reverse search gives the distance from every node to the destination
+        self.estimates = Dijkstra(self.destination, None, self.graph, reverse=True).distance
+
+        if self.source not in self.estimates:
+            return
+
+        first = self.__spur(self.source, set(), set())
+        if first is None:
+            return
+
+        # routes are (distance, edges in travel order, index where the route left its parent)
+        self.routes.append((sum(edge.distance for edge in first), first, 0))
+        candidates = []
+        seen = {self.__key(first)}
+        counter = 0
+
+        while len(self.routes) < self.k:
+            distance, route, deviation = self.routes[-1]
+            root_distance = sum(edge.distance for edge in route[:deviation])
+
+            for index in range(deviation, len(route)):
+                spur_node = route[index].source
+                root = route[:index]
+
+                # edges already taken out of this spur node by known routes sharing the same root
+                banned_edges = set((known[index].source.id, known[index].destination.id)
+                                   for known_distance, known, known_deviation in self.routes
+                                   if len(known) > index and known[:index] == root)
+                banned_nodes = set(edge.source.id for edge in root)
+
+                spur = self.__spur(spur_node, banned_edges, banned_nodes)
+
+                if spur is not None:
+                    candidate = root + spur
+                    key = self.__key(candidate)
+
+                    if key not in seen:
+                        seen.add(key)
+                        counter += 1
+                        heapq.heappush(candidates, (root_distance + sum(edge.distance for edge in spur), counter, index, candidate))
+
+                root_distance += route[index].distance
+
+            if not candidates:
+                break
+
+            distance, counter_value, index, candidate = heapq.heappop(candidates)
+            self.routes.append((distance, candidate, index))
+
+    def __spur(self, spur_node, banned_edges, banned_nodes):
+        """
+        Returns the shortest route from spur_node to the destination avoiding the banned edges and nodes,
+        as a list of edges in travel order, None if there is none.
+        """
+        if spur_node == self.destination:
+            return None
+
+        search = RestrictedAStar(spur_node, self.destination, self.graph, type(self.queue)() if self.queue is not None else None,
+                                 estimates=self.estimates, banned_edges=banned_edges, banned_nodes=banned_nodes)
+        path = search.getPath()
+        return path[::-1] if path else None
+
+    @staticmethod
+    def __key(route) -> tuple:
+        return tuple((edge.source.id, edge.destination.id) for edge in route)
+
+    def getPaths(self) -> list:
+        """
+        Returns up to k routes, shortest first, as a list of dicts with the keys distance and path
+        (edge list in the same order as Dijkstra.getPath)
+        """
+        return [{"distance": distance, "path": route[::-1]} for distance, route, deviation in self.routes]
+
+    def getPath(self) -> list:
+        return self.routes[0][1][::-1] if self.routes else []
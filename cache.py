@@ -0,0 +1,257 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+from algorithms import Dijkstra
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache with an optional time-to-live, safe to share between request threads.
+    Once maxsize entries are stored, adding another evicts the one that was used longest ago.
+    Hits, misses, evictions and expirations are counted for monitoring.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = None) -> None:
+        """
+        Constructor for LRUCache object.
+
+        Arguments:
+            maxsize -- maximum number of entries to keep
+            ttl     -- seconds an entry stays valid, None to keep entries until they are evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        Look up an entry and mark it as the most recently used.
+
+        Arguments:
+            key     -- hashable key of the entry
+            default -- value returned if the key is missing or expired
+
+        Returns:
+            The cached value, default if there is none
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+
+            value, expires = self.entries[key]
+
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """
+        Add or replace an entry, evicting the least recently used entries if the cache is full.
+
+        Arguments:
+            key   -- hashable key of the entry
+            value -- value to store
+
+        Returns:
+            None
+        """
+        with self.lock:
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def rekey(self, function) -> int:
+        """
+        Move every entry to a new key or drop it, keeping the least-recently-used order.
+        Used to carry cached routes over to a new graph version when only some of them are affected.
+
+        Arguments:
+            function -- callable that takes the key and value of an entry and returns its new key, or None to drop it
+
+        Returns:
+            int number of entries dropped
+        """
+        with self.lock:
+            entries = OrderedDict()
+            
+            for key, (value, expires) in self.entries.items():
+                new_key = function(key, value)
+                
+                if new_key is not None:
+                    entries[new_key] = (value, expires)
+            
+            dropped = len(self.entries) - len(entries)
+            self.entries = entries
+            self.invalidations += dropped
+            
+        return dropped
+
+    def clear(self) -> None:
+        """
+        Remove every entry. The counters are kept.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the counters and the current size as a dict
+        """
+        return {"size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations}
+
+
+class TreeCache:
+    """
+    Keeps complete shortest-path trees for recently used sources.
+    A tree is a Dijkstra search run with no destination, so its distance and edgeTo dicts cover every
+    node reachable from the source and Dijkstra.pathTo can answer any destination without searching again.
+    Trees are evicted least recently used first once their estimated size goes over the memory budget.
+    The edges themselves belong to the graph, so only the dicts and distances are counted.
+    """
+    def __init__(self, budget: int = 64 * 1024 * 1024) -> None:
+        """
+        Constructor for TreeCache object.
+
+        Arguments:
+            budget -- estimated number of bytes the cached trees may use
+        """
+        self.budget = budget
+        self.used = 0
+        self.trees = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.trees)
+
+    @staticmethod
+    def sizeOf(tree) -> int:
+        """
+        Returns the estimated number of bytes held by a shortest-path tree
+        """
+        return sys.getsizeof(tree.distance) + sys.getsizeof(tree.edgeTo) + sys.getsizeof(tree.settled) + 24 * len(tree.distance)
+
+    def get(self, source, graph, version=None) -> Dijkstra:
+        """
+        Returns the shortest-path tree of a source, building and caching it if needed.
+
+        Arguments:
+            source  -- Node object the tree is rooted at
+            graph   -- Graph or CompactGraph object to search if the tree is not cached
+            version -- graph version the tree belongs to, trees of other versions are never returned
+
+        Returns:
+            Dijkstra object that was run with destination None
+        """
+        key = (source.id, version)
+
+        with self.lock:
+            if key in self.trees:
+                self.trees.move_to_end(key)
+                self.hits += 1
+                return self.trees[key][0]
+
+            self.misses += 1
+
+        # searching outside the lock, two threads may build the same tree but neither waits on the other
+        tree = Dijkstra(source, None, graph)
+        size = TreeCache.sizeOf(tree)
+
+        with self.lock:
+            if key not in self.trees and size <= self.budget:
+                self.trees[key] = (tree, size)
+                self.used += size
+
+                while self.used > self.budget:
+                    old_tree, old_size = self.trees.popitem(last=False)[1]
+                    self.used -= old_size
+                    self.evictions += 1
+
+        return tree
+
+    def rekey(self, version, stale) -> int:
+        """
+        Carry the trees of the previous graph version over to a new one, dropping those a change made stale.
+        Trees of older versions are dropped too.
+
+        Arguments:
+            version -- the new graph version, trees of version - 1 are carried over
+            stale   -- callable that takes a tree and returns True if it must be dropped
+
+        Returns:
+            int number of trees dropped
+        """
+        with self.lock:
+            trees = OrderedDict()
+            used = 0
+            
+            for (source, old_version), (tree, size) in self.trees.items():
+                if old_version == version - 1 and not stale(tree):
+                    trees[(source, version)] = (tree, size)
+                    used += size
+            
+            dropped = len(self.trees) - len(trees)
+            self.trees = trees
+            self.used = used
+            self.invalidations += dropped
+            
+        return dropped
+
+    def clear(self) -> None:
+        """
+        Remove every tree. The counters are kept.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.trees.clear()
+            self.used = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the counters and the current size as a dict
+        """
+        return {"size": len(self.trees),
+                "bytes": self.used,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations}
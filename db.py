@@ -1,28 +1,257 @@
 import sqlite3
 import os.path
 import sys
+import threading
+from contextlib import contextmanager
 from objects import *
 
+# Rows of the adjacency list, one per edge with both end nodes joined in, in the order the edges were added.
+# Graph keeps the first edge of every source and destination pair, so the order must not depend on the query plan.
+ADJACENCY_SQL = '''SELECT 
+                    edge.source as source_id,
+                    nodes.name as source_name,
+                    nodes.lat as source_lat,
+                    nodes.long as source_long,
+                    nodes.type as source_type,
+                    nodes.description as source_description,
+                    edge.destination as destination_id,
+                    n2.name as destination_name,
+                    n2.lat as destination_lat,
+                    n2.long as destination_long,
+                    n2.type as destination_type,
+                    n2.description as destination_description,
+                    edge.distance as distance,
+                    edge.bus_service as bus_service,
+                    edge.type as edge_type
+                FROM nodes
+                JOIN edge on nodes.id = edge.source
+                JOIN nodes n2 on n2.id = edge.destination
+                ORDER BY edge.id'''
+
+# Schema migrations as (version, description, statements), applied in order by Database.migrate.
+# The version of the last one applied is kept in PRAGMA user_version, so each runs once per database file.
+MIGRATIONS = [
+    (1, "Covering indexes for looking up edges by source or destination", [
+        "CREATE INDEX IF NOT EXISTS edge_source ON edge (source, destination, distance, bus_service, type)",
+        "CREATE INDEX IF NOT EXISTS edge_destination ON edge (destination, source, distance, bus_service, type)",
+    ]),
+    (2, "adjacency view with both end nodes of every edge", [
+        "CREATE VIEW IF NOT EXISTS adjacency AS " + ADJACENCY_SQL,
+    ]),
+    (3, "Graph version, bumped by every change to the nodes or edge tables", [
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT NOT NULL PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('graph_version', 1)",
+    ] + ["""CREATE TRIGGER IF NOT EXISTS {0}_{1}_graph_version AFTER {1} ON {0}
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'graph_version'; END""".format(table, action)
+         for table in ("nodes", "edge") for action in ("INSERT", "UPDATE", "DELETE")]),
+    (4, "Bump the graph version once per write transaction (Database.transaction) instead of once per row", [
+        "DROP TRIGGER IF EXISTS {0}_{1}_graph_version".format(table, action)
+        for table in ("nodes", "edge") for action in ("INSERT", "UPDATE", "DELETE")]),
+]
+
 class Database:
+    """
+    Access to the sqlite3 database, safe to share between request threads.
+
+    Queries borrow a connection from a bounded pool of read-only connections, so concurrent requests read
+    in parallel instead of taking turns on one connection. Writes go through a single writer connection
+    guarded by a lock, one transaction per call. The database is switched to WAL mode so readers are
+    never blocked by a write in progress.
+
+    Every statement is parameterized, and each connection keeps its compiled statements in sqlite3's
+    statement cache, so a repeated query is prepared only once per connection.
+
+    Every write transaction that changes a row bumps the graph version once (see graph_version), however
+    many rows it writes. Writes made by other programs do not bump it; they show in signature instead.
+    """
+    # compiled statements kept per connection
+    STATEMENT_CACHE = 256
+    
+    # ids bound to one IN (...) query, below the variable limit of every SQLite version (999 before 3.32)
+    IN_CHUNK = 500
 
-    def __init__(self, path="./static/data/map.db"):
+    def __init__(self, path="./static/data/map.db", readonly=False, pool_size=8):
         """
         Constructor for DB object. Connects to the sqlite3 database specified by path.
         
         Arguments:
-            path -- a String representing the path to the sqlite3 database
+            path      -- a String representing the path to the sqlite3 database
+            readonly  -- True to refuse every write, for processes that only serve queries; the schema is
+                         only migrated when the database is opened for writing
+            pool_size -- most read connections open at the same time, further readers wait for a free one
         """
         if not os.path.isfile(path):
             print ("Path to sqlite3 database not found in the specified path. Will exit now.")
             sys.exit()
+            
+        self.path = path
+        self.readonly = readonly
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.write_lock = threading.Lock()
+        
         try:
-            self.conn = sqlite3.connect(path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
+            self.writer = self.__connect(readonly)
+            
+            # whether the meta table of migration 3 exists, so writes can bump the graph version
+            self.versioned = False
+            
+            if not readonly:
+                self.writer.execute("PRAGMA journal_mode=WAL")
+                self.versioned = self.migrate() >= 3
             
         except sqlite3.Error as e:
             print(e)
             sys.exit()
     
+    def __connect(self, readonly) -> sqlite3.Connection:
+        """
+        Returns a new connection to the database, opened read-only if readonly is True.
+        Pooled connections are handed from thread to thread, but only one thread uses a connection at a time.
+        """
+        if readonly:
+            conn = sqlite3.connect("file:{}?mode=ro".format(os.path.abspath(self.path)), uri=True,
+                                   check_same_thread=False, cached_statements=self.STATEMENT_CACHE)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.STATEMENT_CACHE)
+            
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    @contextmanager
+    def reader(self):
+        """
+        Borrow a read-only connection from the pool for the duration of a with block.
+
+        Returns:
+            sqlite3.Connection that must not be used after the with block
+        """
+        with self.slots:
+            try:
+                conn = self.idle.pop()
+                
+            except IndexError:
+                conn = self.__connect(True)
+            
+            try:
+                yield conn
+            
+            finally:
+                self.idle.append(conn)
+    
+    def close(self) -> None:
+        """
+        Close the writer connection and every idle read connection.
+
+        Returns:
+            None
+        """
+        with self.write_lock:
+            self.writer.close()
+            
+        while self.idle:
+            self.idle.pop().close()
+    
+    def mtime(self) -> float:
+        """
+        Returns the latest modification time of the database, None if it cannot be read.
+        In WAL mode a commit only appends to the -wal file, the database file itself changes when it is checkpointed.
+        """
+        times = [os.path.getmtime(path) for path in (self.path, self.path + "-wal") if os.path.isfile(path)]
+        return max(times) if times else None
+
+    def signature(self) -> tuple:
+        """
+        Returns (latest modification time, total size) of the database file and its -wal file, None if it cannot be read.
+        Unlike graph_version this also changes when another program writes to the database or the file is replaced.
+        An empty -wal file, as created when the database is opened, holds no changes and is left out.
+        """
+        files = [os.stat(path) for path in (self.path, self.path + "-wal") if os.path.isfile(path)]
+        files = [stat for index, stat in enumerate(files) if index == 0 or stat.st_size > 0]
+        return (max(stat.st_mtime for stat in files), sum(stat.st_size for stat in files)) if files else None
+
+    def migrate(self) -> int:
+        """
+        Apply every migration newer than the schema version of the database, each in its own transaction.
+
+        Returns:
+            int schema version after migrating
+        """
+        with self.write_lock:
+            version = self.writer.execute("PRAGMA user_version").fetchone()[0]
+            
+            for number, description, statements in MIGRATIONS:
+                if number <= version:
+                    continue
+                
+                try:
+                    self.writer.execute("BEGIN")
+                    
+                    for sql in statements:
+                        self.writer.execute(sql)
+                    
+                    self.writer.execute("PRAGMA user_version = {:d}".format(number))
+                    self.writer.commit()
+                    
+                except sqlite3.Error:
+                    self.writer.rollback()
+                    raise
+                
+                version = number
+                
+        return version
+    
+    def schema_version(self) -> int:
+        """
+        Returns the number of the last migration applied to the database
+        """
+        return self.select_one("PRAGMA user_version")["user_version"]
+    
+    def graph_version(self):
+        """
+        Returns a value that changes whenever the nodes or edge tables change, for invalidating anything built
+        from the graph. This is the counter of migration 3, bumped by every write transaction, or the
+        modification time of the database file if it has not been migrated.
+        """
+        try:
+            return self.select_one("SELECT value FROM meta WHERE key = 'graph_version'")["value"]
+        
+        except (sqlite3.Error, TypeError):
+            return self.mtime()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several writes as one transaction on the writer connection, for the duration of a with block.
+        The transaction is committed when the block ends and rolled back if it raises. If it changed any
+        rows, the graph version is bumped once as part of the same transaction.
+
+        Returns:
+            sqlite3.Connection to execute the statements on
+        """
+        with self.write_lock:
+            try:
+                changes = self.writer.total_changes
+                yield self.writer
+                
+                if self.versioned and self.writer.total_changes != changes:
+                    self.writer.execute("UPDATE meta SET value = value + 1 WHERE key = 'graph_version'")
+                
+                self.writer.commit()
+                
+            except BaseException:
+                self.writer.rollback()
+                raise
+
+    def __write(self, sql, data, many=False) -> None:
+        """
+        Run a statement on the writer connection and commit it as one transaction, rolling back on failure.
+        """
+        with self.transaction() as conn:
+            if many:
+                conn.executemany(sql, data)
+            else:
+                conn.execute(sql, data)
 
     def insert_one(self, sql, data) -> None:
         """
@@ -35,13 +264,11 @@ class Database:
         Returns:
             None
         """
-        cursor = self.conn.cursor()
-        cursor.execute(sql, data)
-        self.conn.commit()
+        self.__write(sql, data)
         
     def insert_many(self, sql, data) -> None:
         """
-        Insert multiple rows into the sqlite3 database.
+        Insert multiple rows into the sqlite3 database in one transaction.
 
         Arguments:
             sql  -- a String representing SQL query in the form of a prepared statement
@@ -50,36 +277,64 @@ class Database:
         Returns:
             None
         """
-        cursor = self.conn.cursor()
-        cursor.executemany(sql, data)
-        self.conn.commit()
+        self.__write(sql, data, many=True)
         
-    def select_many(self, sql) -> list:
+    def update(self, sql, data=()) -> None:
+        """
+        Update rows in the sqlite3 database.
+
+        Arguments:
+            sql  -- a String representing SQL query in the form of a prepared statement
+            data -- a dict or tuple containing the parameters of the statement
+
+        Returns:
+            None
+        """
+        self.__write(sql, data)
+        
+    def delete(self, sql, data=()) -> None:
+        """
+        Delete rows from the sqlite3 database.
+
+        Arguments:
+            sql  -- a String representing SQL query in the form of a prepared statement
+            data -- a dict or tuple containing the parameters of the statement
+
+        Returns:
+            None
+        """
+        self.__write(sql, data)
+
+    def select_many(self, sql, data=()) -> list:
         """
         Query a list of data from the sqlite3 database.
 
         Arguments:
-            sql  -- a String representing the SQL SELECT query to execute
+            sql  -- a String representing the SQL SELECT query to execute, with ? or :name placeholders
+            data -- a tuple or dict containing the parameters of the query
 
         Returns:
             List of dict of data for each row, empty list if sqlite3 returns 0 rows
         """
-        c = self.conn.cursor()
-        result = c.execute(sql).fetchall()
+        with self.reader() as conn:
+            result = conn.execute(sql, data).fetchall()
+            
         return [dict(row) for row in result]
 
-    def select_one(self, sql) -> dict:
+    def select_one(self, sql, data=()) -> dict:
         """
         Query a singular row from the sqlite3 database.
 
         Arguments:
-            sql  -- a String representing the SQL SELECT query to execute
+            sql  -- a String representing the SQL SELECT query to execute, with ? or :name placeholders
+            data -- a tuple or dict containing the parameters of the query
 
         Returns:
             Dict representing the row returned, none if sqlite3 returns 0 rows
         """
-        c = self.conn.cursor()
-        result = c.execute(sql).fetchone()
+        with self.reader() as conn:
+            result = conn.execute(sql, data).fetchone()
+            
         return dict(result) if result is not None else None
     
     
@@ -96,16 +351,39 @@ class Database:
             Node object representing the row returned from the SQL query
             None if sqlite3 returns 0 rows
         """
+        data = ()
+        
         if (id is not None):
-            sql = "SELECT * FROM nodes WHERE id = '{}'".format(id)
+            sql, data = "SELECT * FROM nodes WHERE id = ?", (str(id),)
             
         elif (name is not None):
-            sql = "SELECT * FROM nodes WHERE name = '{}'".format(name)
+            sql, data = "SELECT * FROM nodes WHERE name = ?", (name,)
                     
-        result = self.select_one(sql)
+        result = self.select_one(sql, data)
         return Node(data=result) if result is not None else None
     
     
+    def select_nodes(self, ids) -> dict:
+        """
+        Query many Node objects from the sqlite3 database, IN_CHUNK ids per statement.
+
+        Arguments:
+            ids -- iterable of string ids of the nodes to search for
+
+        Returns:
+            Dict of id to Node object, ids that do not exist are left out
+        """
+        ids = list(set(ids))
+        nodes = {}
+        
+        for start in range(0, len(ids), self.IN_CHUNK):
+            chunk = ids[start:start + self.IN_CHUNK]
+            result = self.select_many("SELECT * FROM nodes WHERE id IN ({})".format(", ".join("?" * len(chunk))), chunk)
+            nodes.update((row["id"], Node(data=row)) for row in result)
+        
+        return nodes
+    
+    
     def select_adj_list(self) -> dict:
         """
         Query the edge table in the database and return the data in the form of an adjacency list.
@@ -114,25 +392,6 @@ class Database:
         Returns:
             Graph object representing the adjacency list
         """
-        c = self.conn.cursor()
-        result = self.select_many('''SELECT 
-                                        edge.source as source_id,
-                                        nodes.name as source_name,
-                                        nodes.lat as source_lat,
-                                        nodes.long as source_long,
-                                        nodes.type as source_type,
-                                        nodes.description as source_description,
-                                        edge.destination as destination_id,
-                                        n2.name as destination_name,
-                                        n2.lat as destination_lat,
-                                        n2.long as destination_long,
-                                        n2.type as destination_type,
-                                        n2.description as destination_description,
-                                        edge.distance as distance,
-                                        edge.bus_service as bus_service,
-                                        edge.type as edge_type
-                                    FROM nodes
-                                    JOIN edge on nodes.id = edge.source
-                                    JOIN nodes n2 on n2.id = edge.destination''')
+        result = self.select_many("SELECT * FROM adjacency" if self.schema_version() >= 2 else ADJACENCY_SQL)
         
         return result
\ No newline at end of file
@@ -0,0 +1,257 @@
+from math import isfinite
+from objects import *
+from algorithms import AStar
+
+class GraphEditor:
+    """
+    Operator changes to the network: adding, removing and reweighting single edges and nodes.
+
+    Each change is written to the database and applied to the graph being served through GraphStore.update,
+    as an OverlayGraph over the graph that was loaded, instead of rebuilding the whole graph. The store's
+    onUpdate listeners receive the change as a dict describing what could make earlier results stale:
+        removed       -- Edge objects that are gone, or were replaced by a reweighted edge
+        added         -- Edge objects that are new, or replace a removed edge with a new distance
+        nodes_added   -- Node objects added to the nodes table
+        nodes_removed -- Node objects removed from the nodes table, their edges are listed in removed
+
+    Methods raise ValueError with a message for the user when a change cannot be made.
+    """
+    # edge types that can be added
+    TYPES = ("Walk", "Bus", "MRT")
+
+    def __init__(self, store, database) -> None:
+        """
+        Constructor for GraphEditor object.
+
+        Arguments:
+            store    -- GraphStore object serving the graph
+            database -- Database object the changes are written to
+        """
+        self.store = store
+        self.database = database
+
+    @staticmethod
+    def change(removed=(), added=(), nodes_added=(), nodes_removed=()) -> dict:
+        """
+        Returns a change dict as passed to the onUpdate listeners
+        """
+        return {"removed": list(removed),
+                "added": list(added),
+                "nodes_added": list(nodes_added),
+                "nodes_removed": list(nodes_removed)}
+
+    @staticmethod
+    def overlay(graph) -> OverlayGraph:
+        """
+        Returns a copy of the graph's changes to modify, the served graph itself is never modified.
+        The copy inherits the straight-line heuristic scale of the graph, edges added later lower it if needed.
+        """
+        changed = graph.copy() if isinstance(graph, OverlayGraph) else OverlayGraph(graph)
+        AStar.scales[changed] = AStar.admissibleScale(graph)
+        return changed
+
+    def node(self, id) -> Node:
+        """
+        Returns the Node object with this id, raising ValueError if there is none or id is None
+        """
+        if id is None:
+            raise ValueError("Expected source and destination")
+        
+        node = self.database.select_node(id=id)
+
+        if node is None:
+            raise ValueError("Node {} not found".format(id))
+
+        return node
+
+    @staticmethod
+    def edge(graph, source: Node, destination: Node) -> Edge:
+        """
+        Returns the edge between two nodes in the graph, None if there is none
+        """
+        for edge in graph.adj(source):
+            if edge.destination.id == destination.id:
+                return edge
+
+        return None
+
+    @staticmethod
+    def distance(value) -> float:
+        """
+        Returns value as a finite, non-negative distance in kilometers, raising ValueError otherwise
+        """
+        try:
+            distance = float(value)
+
+        except (TypeError, ValueError):
+            raise ValueError("Expected distance to be a number")
+
+        if not (isfinite(distance) and distance >= 0):
+            raise ValueError("Expected distance to be a finite, non-negative number")
+
+        return distance
+
+    def addNode(self, data: dict) -> int:
+        """
+        Add a node. It has no edges until some are added.
+
+        Arguments:
+            data -- dict with the id, name, description, lat, long and type of the node
+
+        Returns:
+            int version number of the changed graph
+        """
+        try:
+            node = Node(data={"id": str(data["id"]),
+                              "name": str(data["name"]),
+                              "description": str(data.get("description", "")),
+                              "lat": float(data["lat"]),
+                              "long": float(data["long"]),
+                              "type": str(data["type"])})
+
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Expected id, name, lat, long and type")
+        
+        if not (isfinite(node.lat) and isfinite(node.long)):
+            raise ValueError("Expected lat and long to be finite numbers")
+
+        def edit(graph):
+            if self.database.select_node(id=node.id) is not None:
+                raise ValueError("Node {} already exists".format(node.id))
+
+            self.database.insert_one('''INSERT INTO nodes (id, name, description, lat, long, type)
+                                        VALUES (:id, :name, :description, :lat, :long, :type)''', node.toDict())
+            return (graph, GraphEditor.change(nodes_added=[node]))
+
+        return self.store.update(edit)
+
+    def removeNode(self, id) -> int:
+        """
+        Remove a node together with every edge leaving or arriving at it.
+
+        Arguments:
+            id -- string id of the node
+
+        Returns:
+            int version number of the changed graph
+        """
+        def edit(graph):
+            node = self.node(id)
+            changed = GraphEditor.overlay(graph)
+            removed = []
+
+            for edge in list(graph.adj(node)) + list(graph.radj(node)):
+                if changed.removeEdge(edge.source, edge.destination) is not None:
+                    removed.append(edge)
+
+            with self.database.transaction() as conn:
+                conn.execute("DELETE FROM edge WHERE source = ? OR destination = ?", (node.id, node.id))
+                conn.execute("DELETE FROM nearby_bus_stops WHERE source = ? OR bus_stop_code = ?", (node.id, node.id))
+                conn.execute("DELETE FROM nodes WHERE id = ?", (node.id,))
+
+            return (changed, GraphEditor.change(removed=removed, nodes_removed=[node]))
+
+        return self.store.update(edit)
+
+    def addEdge(self, source, destination, distance=None, bus_service="0", type="Walk") -> int:
+        """
+        Add an edge between two existing nodes.
+
+        Arguments:
+            source      -- string id of the source node
+            destination -- string id of the destination node
+            distance    -- distance in kilometers, None for the straight-line distance between the nodes
+            bus_service -- bus service of the edge, "0" if it is not a bus route
+            type        -- type of the edge, one of TYPES
+
+        Returns:
+            int version number of the changed graph
+        """
+        if type not in GraphEditor.TYPES:
+            raise ValueError("Expected type to be one of {}".format(", ".join(GraphEditor.TYPES)))
+
+        def edit(graph):
+            source_node, destination_node = self.node(source), self.node(destination)
+
+            if source_node.id == destination_node.id:
+                raise ValueError("An edge needs two different nodes")
+
+            if GraphEditor.edge(graph, source_node, destination_node) is not None:
+                raise ValueError("Edge from {} to {} already exists".format(source_node.id, destination_node.id))
+
+            edge = Edge(source=source_node,
+                        destination=destination_node,
+                        distance=source_node.distanceTo(destination_node) if distance is None else GraphEditor.distance(distance),
+                        bus_service=str(bus_service),
+                        type=type)
+
+            self.database.insert_one('''INSERT INTO edge (source, destination, distance, bus_service, type)
+                                        VALUES (:source, :destination, :distance, :bus_service, :type)''',
+                                     {"source": source_node.id,
+                                      "destination": destination_node.id,
+                                      "distance": edge.distance,
+                                      "bus_service": edge.bus_service,
+                                      "type": edge.type})
+
+            changed = GraphEditor.overlay(graph)
+            changed.addEdge(edge)
+            AStar.scales[changed] = min(AStar.scales[changed], AStar.straightRatio([edge]))
+            return (changed, GraphEditor.change(added=[edge]))
+
+        return self.store.update(edit)
+
+    def removeEdge(self, source, destination) -> int:
+        """
+        Remove the edge between two nodes.
+
+        Arguments:
+            source      -- string id of the source node
+            destination -- string id of the destination node
+
+        Returns:
+            int version number of the changed graph
+        """
+        def edit(graph):
+            source_node, destination_node = self.node(source), self.node(destination)
+            changed = GraphEditor.overlay(graph)
+            edge = changed.removeEdge(source_node, destination_node)
+
+            if edge is None:
+                raise ValueError("Edge from {} to {} not found".format(source_node.id, destination_node.id))
+
+            self.database.delete("DELETE FROM edge WHERE source = ? AND destination = ?", (source_node.id, destination_node.id))
+            return (changed, GraphEditor.change(removed=[edge]))
+
+        return self.store.update(edit)
+
+    def reweightEdge(self, source, destination, distance) -> int:
+        """
+        Change the distance of the edge between two nodes.
+
+        Arguments:
+            source      -- string id of the source node
+            destination -- string id of the destination node
+            distance    -- new distance in kilometers
+
+        Returns:
+            int version number of the changed graph
+        """
+        distance = GraphEditor.distance(distance)
+
+        def edit(graph):
+            source_node, destination_node = self.node(source), self.node(destination)
+            changed = GraphEditor.overlay(graph)
+            old = changed.removeEdge(source_node, destination_node)
+
+            if old is None:
+                raise ValueError("Edge from {} to {} not found".format(source_node.id, destination_node.id))
+
+            edge = Edge(source=old.source, destination=old.destination, distance=distance, bus_service=old.bus_service, type=old.type)
+            changed.addEdge(edge)
+            AStar.scales[changed] = min(AStar.scales[changed], AStar.straightRatio([edge]))
+
+            self.database.update("UPDATE edge SET distance = ? WHERE source = ? AND destination = ?",
+                                 (distance, source_node.id, destination_node.id))
+            return (changed, GraphEditor.change(removed=[old], added=[edge]))
+
+        return self.store.update(edit)
@@ -0,0 +1,97 @@
+from math import cos, asin, sqrt
+
+# Bulk versions of Node.distanceTo. Distances are in kilometers and never rounded, so they can be used as
+# search heuristics. NumPy does the work on whole arrays when it is installed; without it the same functions
+# fall back to plain Python loops and return lists.
+try:
+    import numpy
+
+except ImportError:
+    numpy = None
+
+# diameter of the earth in kilometers and degrees to radians, as used by Node.distanceTo
+DIAMETER = 12742
+RADIANS = 0.017453292519943295
+
+
+def coordinates(nodes) -> tuple:
+    """
+    Split Node objects into latitude and longitude arrays.
+
+    Arguments:
+        nodes -- list of Node objects
+
+    Returns:
+        Tuple of (latitudes, longitudes), NumPy float arrays if NumPy is installed, lists otherwise
+    """
+    lats = [node.lat for node in nodes]
+    longs = [node.long for node in nodes]
+
+    if numpy is None:
+        return (lats, longs)
+
+    return (numpy.asarray(lats, dtype=float), numpy.asarray(longs, dtype=float))
+
+
+def pairwise(lats1, longs1, lats2, longs2):
+    """
+    Distance between each coordinate in the first arrays and the coordinate at the same position in the second.
+    With NumPy, scalars and arrays of different shapes are broadcast against each other.
+
+    Arguments:
+        lats1, longs1 -- latitudes and longitudes of the first points
+        lats2, longs2 -- latitudes and longitudes of the second points
+
+    Returns:
+        Distances in kilometers, a NumPy array if NumPy is installed, a list otherwise
+    """
+    if numpy is None:
+        return [_haversine(lat1, long1, lat2, long2) for lat1, long1, lat2, long2 in zip(lats1, longs1, lats2, longs2)]
+
+    lats1, longs1 = numpy.asarray(lats1, dtype=float), numpy.asarray(longs1, dtype=float)
+    lats2, longs2 = numpy.asarray(lats2, dtype=float), numpy.asarray(longs2, dtype=float)
+
+    a = (0.5 - numpy.cos((lats2 - lats1) * RADIANS) / 2 +
+         numpy.cos(lats1 * RADIANS) * numpy.cos(lats2 * RADIANS) * (1 - numpy.cos((longs2 - longs1) * RADIANS)) / 2)
+
+    return DIAMETER * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0.0, 1.0)))
+
+
+def oneToMany(lat, long, lats, longs):
+    """
+    Distance from one point to every point in the arrays.
+
+    Arguments:
+        lat, long   -- latitude and longitude of the single point
+        lats, longs -- latitudes and longitudes of the other points
+
+    Returns:
+        Distances in kilometers, one per point in lats/longs
+    """
+    if numpy is None:
+        return [_haversine(lat, long, other_lat, other_long) for other_lat, other_long in zip(lats, longs)]
+
+    return pairwise(lat, long, lats, longs)
+
+
+def manyToMany(lats1, longs1, lats2, longs2):
+    """
+    Distance from every point in the first arrays to every point in the second.
+
+    Arguments:
+        lats1, longs1 -- latitudes and longitudes of the N origins
+        lats2, longs2 -- latitudes and longitudes of the M destinations
+
+    Returns:
+        N x M distances in kilometers, a 2D NumPy array if NumPy is installed, a list of lists otherwise
+    """
+    if numpy is None:
+        return [oneToMany(lat, long, lats2, longs2) for lat, long in zip(lats1, longs1)]
+
+    lats1, longs1 = numpy.asarray(lats1, dtype=float), numpy.asarray(longs1, dtype=float)
+    return pairwise(lats1[:, None], longs1[:, None], lats2, longs2)
+
+
+def _haversine(lat1, long1, lat2, long2) -> float:
+    a = 0.5 - cos((lat2 - lat1) * RADIANS) / 2 + cos(lat1 * RADIANS) * cos(lat2 * RADIANS) * (1 - cos((long2 - long1) * RADIANS)) / 2
+    return DIAMETER * asin(sqrt(min(max(a, 0.0), 1.0)))
@@ -0,0 +1,412 @@
+import sys
+import heapq
+import pickle
+import hashlib
+import os.path
+from objects import *
+from algorithms import Algorithm
+
+class ContractionHierarchy:
+    """
+    Contraction Hierarchy built from a Graph or CompactGraph.
+
+    Nodes are contracted one at a time, least important first. Contracting a node removes it from the
+    remaining graph and adds a shortcut u -> w for every pair of neighbours whose only shortest path
+    ran through it. A local witness search decides whether such a path exists without the node.
+    Once every node is contracted, each edge only needs to be followed towards the more important
+    (higher ranked) end, which is what CHDijkstra does.
+
+    Every edge, original or shortcut, is kept in edges as (source id, destination id) -> (distance, middle id).
+    middle is None for original edges, so a shortcut can be unpacked back into the original Edge objects.
+    """
+    FORMAT = 1
+
+    # a witness search gives up after settling this many nodes and the shortcut is added anyway
+    WITNESS_LIMIT = 500
+
+    def __init__(self, graph=None) -> None:
+        """
+        Constructor for ContractionHierarchy object. Contracts the graph straight away if one is given,
+        otherwise use ContractionHierarchy.load.
+
+        Arguments:
+            graph -- Graph or CompactGraph object to contract
+        """
+        self.nodes = {}
+        self.rank = {}
+        self.up = {}
+        self.down = {}
+        self.edges = {}
+        self.original = {}
+        self.fingerprint = None
+
+        if graph is not None:
+            self.build(graph)
+
+    def __repr__(self) -> str:
+        """
+        Returns a string representation of this object.
+        """
+        shortcuts = sum(1 for distance, middle in self.edges.values() if middle is not None)
+        return "ContractionHierarchy({} nodes, {} shortcuts)".format(len(self.nodes), shortcuts)
+
+    @staticmethod
+    def fingerprintOf(graph) -> str:
+        """
+        Returns a hash of every edge in the graph, used to tell whether a saved hierarchy still matches.
+
+        Arguments:
+            graph -- Graph or CompactGraph object
+
+        Returns:
+            String hex digest
+        """
+        digest = hashlib.sha1()
+
+        for line in sorted("{}>{}:{}:{}:{}".format(edge.source.id, edge.destination.id, edge.distance, edge.bus_service, edge.type)
+                           for node in graph.vertices() for edge in graph.adj(node)):
+            digest.update(line.encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def build(self, graph) -> None:
+        """
+        Order and contract every node in the graph.
+
+        Arguments:
+            graph -- Graph or CompactGraph object to contract
+
+        Returns:
+            None
+        """
+        self.fingerprint = ContractionHierarchy.fingerprintOf(graph)
+
+        # remaining graph, id -> {neighbour id: (distance, middle id)}
+        outgoing = {}
+        incoming = {}
+
+        for node in graph.vertices():
+            for edge in graph.adj(node):
+                source, destination = edge.source.id, edge.destination.id
+                self.nodes[source] = edge.source
+                self.nodes[destination] = edge.destination
+                outgoing.setdefault(source, {})
+                outgoing.setdefault(destination, {})
+                incoming.setdefault(source, {})
+                incoming.setdefault(destination, {})
+
+                if source == destination:
+                    continue
+
+                if destination not in outgoing[source] or edge.distance < outgoing[source][destination][0]:
+                    outgoing[source][destination] = (edge.distance, None)
+                    incoming[destination][source] = (edge.distance, None)
+                    self.original[(source, destination)] = (edge.distance, edge.bus_service, edge.type)
+
+        contracted_neighbours = {id: 0 for id in self.nodes}
+        queue = [(self.__importance(id, outgoing, incoming, contracted_neighbours), id) for id in self.nodes]
+        heapq.heapify(queue)
+
+        while queue:
+            importance, id = heapq.heappop(queue)
+
+            # importance goes stale as neighbours get contracted, re-check it before committing (lazy update)
+            current = self.__importance(id, outgoing, incoming, contracted_neighbours)
+            if queue and current > queue[0][0]:
+                heapq.heappush(queue, (current, id))
+                continue
+
+            for source, destination, distance in self.__shortcuts(id, outgoing, incoming):
+                outgoing[source][destination] = (distance, id)
+                incoming[destination][source] = (distance, id)
+
+            self.rank[id] = len(self.rank)
+            self.up[id] = [(neighbour, distance) for neighbour, (distance, middle) in outgoing[id].items()]
+            self.down[id] = [(neighbour, distance) for neighbour, (distance, middle) in incoming[id].items()]
+
+            for neighbour, value in outgoing[id].items():
+                self.edges[(id, neighbour)] = value
+                del incoming[neighbour][id]
+                contracted_neighbours[neighbour] += 1
+
+            for neighbour, value in incoming[id].items():
+                self.edges[(neighbour, id)] = value
+                del outgoing[neighbour][id]
+                contracted_neighbours[neighbour] += 1
+
+            del outgoing[id]
+            del incoming[id]
+
+    def __importance(self, id, outgoing, incoming, contracted_neighbours) -> int:
+        """
+        Edge difference of contracting a node, plus the number of neighbours already contracted so that
+        contraction spreads evenly over the graph.
+        """
+        shortcuts = len(self.__shortcuts(id, outgoing, incoming))
+        return shortcuts - len(outgoing[id]) - len(incoming[id]) + contracted_neighbours[id]
+
+    def __shortcuts(self, id, outgoing, incoming) -> list:
+        """
+        Returns the shortcuts needed to contract a node, as a list of (source id, destination id, distance).
+        """
+        shortcuts = []
+
+        for source, (in_distance, middle) in incoming[id].items():
+            targets = {destination: in_distance + out_distance
+                       for destination, (out_distance, middle) in outgoing[id].items() if destination != source}
+
+            if not targets:
+                continue
+
+            witness = self.__witness(source, id, max(targets.values()), outgoing)
+
+            for destination, distance in targets.items():
+                if witness.get(destination, float('inf')) > distance:
+                    shortcuts.append((source, destination, distance))
+
+        return shortcuts
+
+    def __witness(self, source, ignore, limit, outgoing) -> dict:
+        """
+        Local Dijkstra from source in the remaining graph that never passes through ignore.
+        Stops once distances go past limit or WITNESS_LIMIT nodes have been settled.
+
+        Returns:
+            Dict of id to the shortest distance found
+        """
+        distance = {source: 0.0}
+        settled = set()
+        queue = [(0.0, source)]
+
+        while queue and len(settled) < self.WITNESS_LIMIT:
+            current_distance, current = heapq.heappop(queue)
+
+            if current in settled:
+                continue
+
+            if current_distance > limit:
+                break
+
+            settled.add(current)
+
+            for neighbour, (edge_distance, middle) in outgoing[current].items():
+                if neighbour == ignore:
+                    continue
+
+                next_distance = current_distance + edge_distance
+                if next_distance < distance.get(neighbour, float('inf')):
+                    distance[neighbour] = next_distance
+                    heapq.heappush(queue, (next_distance, neighbour))
+
+        return distance
+
+    def unpack(self, source, destination) -> list:
+        """
+        Expand an edge of the hierarchy into the original edges it stands for.
+
+        Arguments:
+            source      -- id of the edge's source node
+            destination -- id of the edge's destination node
+
+        Returns:
+            List of Edge objects from source to destination, in travel order
+        """
+        path = []
+        stack = [(source, destination)]
+
+        while stack:
+            source, destination = stack.pop()
+            distance, middle = self.edges[(source, destination)]
+
+            if middle is None:
+                distance, bus_service, type = self.original[(source, destination)]
+                path.append(Edge(source=self.nodes[source],
+                                 destination=self.nodes[destination],
+                                 distance=distance,
+                                 bus_service=bus_service,
+                                 type=type))
+            else:
+                # second half is pushed first so the first half comes off the stack first
+                stack.append((middle, destination))
+                stack.append((source, middle))
+
+        return path
+
+    def save(self, path) -> None:
+        """
+        Write the hierarchy to a file.
+
+        Arguments:
+            path -- String path of the file to write
+
+        Returns:
+            None
+        """
+        with open(path, "wb") as file:
+            pickle.dump({"format": self.FORMAT,
+                         "fingerprint": self.fingerprint,
+                         "rank": self.rank,
+                         "up": self.up,
+                         "down": self.down,
+                         "edges": self.edges,
+                         "original": self.original}, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path, graph):
+        """
+        Read a hierarchy written by save. The Node objects are taken from the graph, which must be the
+        same graph the hierarchy was built from.
+
+        Arguments:
+            path  -- String path of the file to read
+            graph -- Graph or CompactGraph object the hierarchy was built from
+
+        Returns:
+            ContractionHierarchy object, None if the file is missing, unreadable or was built from a different graph
+        """
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with open(path, "rb") as file:
+                data = pickle.load(file)
+
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        if data.get("format") != ContractionHierarchy.FORMAT or data.get("fingerprint") != ContractionHierarchy.fingerprintOf(graph):
+            return None
+
+        hierarchy = ContractionHierarchy()
+        hierarchy.fingerprint = data["fingerprint"]
+        hierarchy.rank = data["rank"]
+        hierarchy.up = data["up"]
+        hierarchy.down = data["down"]
+        hierarchy.edges = data["edges"]
+        hierarchy.original = data["original"]
+
+        for node in graph.vertices():
+            for edge in graph.adj(node):
+                hierarchy.nodes[edge.source.id] = edge.source
+                hierarchy.nodes[edge.destination.id] = edge.destination
+
+        return hierarchy
+
+    @staticmethod
+    def loadOrBuild(path, graph):
+        """
+        Load the hierarchy saved at path if it matches the graph, otherwise contract the graph and save the result.
+
+        Arguments:
+            path  -- String path of the hierarchy file
+            graph -- Graph or CompactGraph object
+
+        Returns:
+            ContractionHierarchy object
+        """
+        hierarchy = ContractionHierarchy.load(path, graph)
+
+        if hierarchy is None:
+            hierarchy = ContractionHierarchy(graph)
+
+            try:
+                hierarchy.save(path)
+
+            except OSError as e:
+                print(e)
+
+        return hierarchy
+
+
+class CHDijkstra(Algorithm):
+    """
+    Query on a ContractionHierarchy. Pass the hierarchy in place of the graph.
+    A forward search from the source and a backward search from the destination both only climb to
+    higher ranked nodes, so each settles a handful of nodes no matter how large the network is.
+    The shortest route goes through the node where the sum of both distances is smallest, and its
+    shortcuts are unpacked so getPath returns the same edge list as Dijkstra.
+    """
+    name = "Contraction Hierarchy Query"
+
+    def __init__(self, source: Node, destination: Node, graph: ContractionHierarchy, queue: PriorityQueue = None) -> None:
+        super().__init__(source, destination, graph, queue if queue is not None else IndexedMinHeap())
+
+        self.distance = [{self.source.id: 0.0}, {self.destination.id: 0.0}]
+        self.parent = [{self.source.id: None}, {self.destination.id: None}]
+        self.settled = [set(), set()]
+        self.queues = [self.queue, type(self.queue)()]
+
+        self.best = float('inf')
+        self.meeting = None
+
+        for side, id in enumerate((self.source.id, self.destination.id)):
+            if id in self.graph.rank:
+                self.queues[side].push(PQItem(0.0, id))
+
+        while True:
+            # a side is done once its queue is empty or its minimum can no longer beat the best route
+            active = [side for side in (0, 1)
+                      if not self.queues[side].isEmpty() and self.queues[side].getMin().priority < self.best]
+
+            if not active:
+                break
+
+            side = min(active, key=lambda side: self.queues[side].getMin().priority)
+            current = self.queues[side].pop().element
+
+            if current in self.settled[side]:
+                continue
+
+            self.settled[side].add(current)
+
+            if current in self.distance[1 - side]:
+                total = self.distance[side][current] + self.distance[1 - side][current]
+
+                if total < self.best:
+                    self.best = total
+                    self.meeting = current
+
+            edges = self.graph.up[current] if side == 0 else self.graph.down[current]
+
+            for neighbour, edge_distance in edges:
+                next_distance = self.distance[side][current] + edge_distance
+
+                if next_distance < self.distance[side].get(neighbour, float('inf')):
+                    self.distance[side][neighbour] = next_distance
+                    self.parent[side][neighbour] = current
+                    self.queues[side].decreaseKey(neighbour, next_distance)
+
+    def getPath(self) -> list:
+        if self.meeting is None or self.source.id == self.destination.id:
+            return []
+
+        # hierarchy edges in travel order: source up to the meeting node, then down to the destination
+        hops = []
+        id = self.meeting
+
+        while self.parent[0][id] is not None:
+            hops.append((self.parent[0][id], id))
+            id = self.parent[0][id]
+
+        hops.reverse()
+        id = self.meeting
+
+        while self.parent[1][id] is not None:
+            hops.append((id, self.parent[1][id]))
+            id = self.parent[1][id]
+
+        path = []
+        for source, destination in hops:
+            path.extend(self.graph.unpack(source, destination))
+
+        # same order as Dijkstra.getPath, last edge first
+        return path[::-1]
+
+
+if __name__ == "__main__":
+    import db
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "./static/data/map.ch"
+    hierarchy = ContractionHierarchy(Graph(db.Database().select_adj_list()))
+    hierarchy.save(path)
+    print("Saved {} to {}".format(hierarchy, path))
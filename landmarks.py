@@ -0,0 +1,175 @@
+from array import array
+from objects import *
+from algorithms import Dijkstra, AStar
+
+class Landmarks:
+    """
+    Landmark distances for the ALT (A-Star, Landmarks, Triangle inequality) heuristic.
+
+    A few nodes are picked as landmarks and the exact shortest distance from every node to each landmark,
+    and from each landmark to every node, is computed once. By the triangle inequality, for any node v,
+    target t and landmark L:
+        d(v, t) >= d(v, L) - d(t, L)
+        d(v, t) >= d(L, t) - d(L, v)
+    so the largest of these over all landmarks is a lower bound that follows the real network, detours
+    included, instead of a straight line.
+
+    Nodes are interned to dense integers and the distances are kept in one array('d') per landmark and
+    direction, float('inf') marking nodes that cannot reach or be reached from the landmark.
+    """
+    def __init__(self, graph, count: int = 8) -> None:
+        """
+        Constructor for Landmarks object. Picks the landmarks and computes their distances.
+
+        Arguments:
+            graph -- Graph or CompactGraph object
+            count -- number of landmarks to pick
+        """
+        self.nodes = []
+        self.index = {}
+
+        for node in graph.vertices():
+            for edge in graph.adj(node):
+                for end in (edge.source, edge.destination):
+                    if end.id not in self.index:
+                        self.index[end.id] = len(self.nodes)
+                        self.nodes.append(end)
+
+        self.landmarks = []
+        self.forward = []   # forward[i][v] is the distance from landmark i to node v
+        self.backward = []  # backward[i][v] is the distance from node v to landmark i
+
+        self.select(graph, min(count, len(self.nodes)))
+
+    def __repr__(self) -> str:
+        """
+        Returns a string representation of this object.
+        """
+        return "Landmarks({})".format(", ".join(node.id for node in self.landmarks))
+
+    def select(self, graph, count: int) -> None:
+        """
+        Farthest-point selection: each new landmark is the node whose closest landmark is furthest away,
+        measured as the round trip d(L, v) + d(v, L). Nodes that no landmark can reach count as infinitely
+        far, so parts of the network the other landmarks cannot see get a landmark of their own.
+        The first landmark is the node furthest from an arbitrary starting node, which is then dropped.
+
+        Arguments:
+            graph -- Graph or CompactGraph object
+            count -- number of landmarks to pick
+
+        Returns:
+            None
+        """
+        if count == 0:
+            return
+
+        inf = float('inf')
+        closest = [inf] * len(self.nodes)
+
+        forward, backward = self.__distances(graph, self.nodes[0])
+        round_trip = [forward[v] + backward[v] for v in range(len(self.nodes))]
+        candidate = max(range(len(self.nodes)), key=lambda v: round_trip[v] if round_trip[v] < inf else -1)
+
+        while len(self.landmarks) < count:
+            landmark = self.nodes[candidate]
+            forward, backward = self.__distances(graph, landmark)
+
+            self.landmarks.append(landmark)
+            self.forward.append(forward)
+            self.backward.append(backward)
+
+            for v in range(len(self.nodes)):
+                closest[v] = min(closest[v], forward[v] + backward[v])
+
+            chosen = set(self.index[node.id] for node in self.landmarks)
+            remaining = [v for v in range(len(self.nodes)) if v not in chosen]
+
+            if not remaining:
+                break
+
+            candidate = max(remaining, key=lambda v: closest[v])
+
+    def __distances(self, graph, landmark) -> tuple:
+        """
+        Returns (distances from the landmark, distances to the landmark) as arrays indexed by node.
+        """
+        forward = array('d', [float('inf')] * len(self.nodes))
+        backward = array('d', [float('inf')] * len(self.nodes))
+
+        for node, distance in Dijkstra(landmark, None, graph).distance.items():
+            forward[self.index[node.id]] = distance
+
+        for node, distance in Dijkstra(landmark, None, graph, reverse=True).distance.items():
+            backward[self.index[node.id]] = distance
+
+        return (forward, backward)
+
+    def target(self, target) -> list:
+        """
+        Returns the per-landmark distances of a target node, looked up once per query.
+
+        Arguments:
+            target -- Node object the search is heading to
+
+        Returns:
+            List of (landmark index, d(t, L), d(L, t)) tuples, empty if the target is not in the graph
+        """
+        t = self.index.get(target.id)
+
+        if t is None:
+            return []
+
+        return [(i, self.backward[i][t], self.forward[i][t]) for i in range(len(self.landmarks))]
+
+    def lowerBound(self, node, target) -> float:
+        """
+        Returns the best triangle-inequality lower bound on the distance from node to the target.
+
+        Arguments:
+            node   -- Node object
+            target -- list returned by Landmarks.target for the destination
+
+        Returns:
+            float lower bound, float('inf') if the landmarks prove the target cannot be reached
+        """
+        v = self.index.get(node.id)
+
+        if v is None:
+            return 0.0
+
+        inf = float('inf')
+        bound = 0.0
+
+        for i, to_landmark, from_landmark in target:
+            node_to, node_from = self.backward[i][v], self.forward[i][v]
+
+            # d(v, t) >= d(v, L) - d(t, L), only meaningful when t can reach L
+            if to_landmark < inf:
+                bound = max(bound, node_to - to_landmark)
+
+            # d(v, t) >= d(L, t) - d(L, v), only meaningful when L can reach v
+            if node_from < inf:
+                bound = max(bound, from_landmark - node_from)
+
+        return bound
+
+
+class ALTAStar(AStar):
+    """
+    A-Star search using landmark lower bounds. The heuristic is the larger of the landmark bound and
+    AStar's scaled straight-line distance; both are consistent, so the route is still the shortest.
+    Pass the Landmarks object built for the same graph.
+    """
+    name = "A-Star Algorithm with Landmarks"
+
+    def __init__(self, source: Node, destination: Node, graph: Graph, queue: PriorityQueue = None, landmarks: Landmarks = None) -> None:
+        self.landmarks = landmarks if landmarks is not None else Landmarks(graph)
+        self.target = self.landmarks.target(destination) if destination is not None else []
+        super().__init__(source, destination, graph, queue)
+
+    def heuristic(self, node) -> float:
+        if self.destination is None:
+            return 0.0
+
+        return max(self.landmarks.lowerBound(node, self.target), super().heuristic(node))
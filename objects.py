@@ -1,9 +1,20 @@
-import json
+import sys
 import heapq
+import threading
+import weakref
+from collections import OrderedDict
+from array import array
 from math import cos, asin, sqrt
 from abc import ABC, abstractmethod
 
 class Node:
+    """
+    A place in the network. Nodes are identified by their id alone: two Node objects with the same id are
+    equal and hash the same, whichever query created them. The hash is computed once, and __slots__ keeps
+    each object small since the graphs hold one per node (see rowNode).
+    """
+    __slots__ = ("id", "name", "description", "lat", "long", "type", "hash", "__weakref__")
+
     def __init__(self, id=None, name=None, description=None, lat=None, long=None, type=None, data=None):
         """
         Constructor for Node object. You can call this by passing the values of each field seperately 
@@ -19,26 +30,33 @@ class Node:
             data        -- dict containing all the above fields and their respective values
         """
         if not data is None:
-            self.id = data["id"]
-            self.name = data["name"]
-            self.description = data["description"]
-            self.lat = data["lat"]
-            self.long = data["long"]
-            self.type = data["type"]
+            id, name, description = data["id"], data["name"], data["description"]
+            lat, long, type = data["lat"], data["long"], data["type"]
         
-        else:
-            self.id = id
-            self.name = name
-            self.description = description
-            self.lat = lat
-            self.long = long
-            self.type = type
+        self.id = intern(id)
+        self.name = name
+        self.description = description
+        self.lat = lat
+        self.long = long
+        self.type = intern(type)
+        self.hash = hash(self.id)
         
     def __repr__(self):
         """
         Returns a string representation of this object.
         """
-        return str(self.__dict__)
+        return str(self.toDict())
+    
+    def toDict(self) -> dict:
+        """
+        Returns the fields of this object as a dict, used to serialize it to JSON
+        """
+        return {"id": self.id,
+                "name": self.name,
+                "description": self.description,
+                "lat": self.lat,
+                "long": self.long,
+                "type": self.type}
     
     def __eq__(self, other):
         """
@@ -48,16 +66,11 @@ class Node:
             other -- the target node object to compare to
             
         Returns:
-            True if two object have the same values for every fields
+            True if two object have the same id
             False otherwise
         """
         if isinstance(other, Node):
-            return ((self.id == other.id) and 
-                    (self.lat == other.lat) and 
-                    (self.long == other.long) and 
-                    (self.type == other.type) and
-                    (self.name == other.name) and
-                    (self.description == other.description))
+            return self.id == other.id
         
         return False
     
@@ -69,14 +82,15 @@ class Node:
         Returns:
             int representing the hash of this object
         """
-        return hash((self.id, self.lat, self.long, self.type, self.name, self.description))
+        return self.hash
     
-    def distanceTo(self, other) -> float:
+    def distanceTo(self, other, exact=False) -> float:
         """
         Calculates the distance between two node objects
 
         Arguments:
             other -- the target node object to calculate distance 
+            exact -- skip the rounding, needed when the distance is used as a search heuristic
 
         Returns:
             Float representation of the distance between the two node objects in kilometers, rounded to two decimal places
@@ -86,9 +100,16 @@ class Node:
 
         p = 0.017453292519943295
         a = 0.5 - cos((lat2-lat1)*p)/2 + cos(lat1*p)*cos(lat2*p) * (1-cos((lon2-lon1)*p)) / 2
-        return round(12742 * asin(sqrt(a)), 2)
+        distance = 12742 * asin(sqrt(a))
+        return distance if exact else round(distance, 2)
 
 class Edge:
+    """
+    A directed connection between two nodes. Uses __slots__ like Node, and its hash is computed on first use
+    and kept, as it is built from the ids of both nodes and the other fields.
+    """
+    __slots__ = ("source", "destination", "distance", "bus_service", "type", "hash")
+
     def __init__(self, source=None, destination=None, distance=None, bus_service=None, type=None, data=None):
         """
         Constructor for Edge object. You can call this by passing the values of each field seperately 
@@ -104,24 +125,33 @@ class Edge:
             data        -- dict containing all the above fields and their respective values
         """
         if not data is None:
-            self.source = data["source"]
-            self.distance = data["distance"]
-            self.destination = data["destination"]
-            self.bus_service = data["bus_service"]
-            self.type = data["type"]
+            source, destination, distance = data["source"], data["destination"], data["distance"]
+            bus_service, type = data["bus_service"], data["type"]
         
-        else:
-            self.source = source
-            self.distance = distance
-            self.destination = destination
-            self.bus_service = bus_service
-            self.type = type
+        self.source = source
+        self.distance = distance
+        self.destination = destination
+        self.bus_service = intern(bus_service)
+        self.type = intern(type)
+        self.hash = None
             
     def __repr__(self) -> str:
         """
         Returns a string representation of this object.
         """
-        return json.dumps(self, default=lambda o: o.__dict__, indent=4)
+        return "Edge({} -> {}, {} km, {} {})".format(self.source.id if self.source is not None else None,
+                                                     self.destination.id if self.destination is not None else None,
+                                                     self.distance, self.type, self.bus_service)
+    
+    def toDict(self) -> dict:
+        """
+        Returns the fields of this object as a dict, used to serialize it to JSON. The nodes are left as Node objects.
+        """
+        return {"source": self.source,
+                "distance": self.distance,
+                "destination": self.destination,
+                "bus_service": self.bus_service,
+                "type": self.type}
     
     def __eq__(self, other):
         """
@@ -151,39 +181,80 @@ class Edge:
     
     def __hash__(self) -> int:
         """
-        Return hash for this Node object.
-        This is needed to use this Node object as a key in a dictionary
+        Return hash for this Edge object.
+        This is needed to use this Edge object as a key in a dictionary
 
         Returns:
             int representing the hash of this object
         """
-        return hash((self.source, self.destination, self.distance, self.type, self.bus_service))
+        if self.hash is None:
+            self.hash = hash((self.source, self.destination, self.distance, self.type, self.bus_service))
+            
+        return self.hash
     
+
+def intern(value):
+    """
+    Returns the interned copy of a string, so the many nodes and edges sharing a value such as "Bus Stop" or
+    a bus service number share one string object; anything other than a string is returned unchanged
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def rowNode(nodes, dic, prefix) -> Node:
+    """
+    Returns the Node object described by the source_* or destination_* fields of an adjacency list row,
+    reusing the one already in nodes, a dict of id to Node object, so every edge at a node shares one object.
+
+    Arguments:
+        nodes  -- dict (or WeakValueDictionary) of id to the Node objects created so far, the new one is added
+        dic    -- dict of an adjacency list row, as returned by Database.select_adj_list
+        prefix -- "source" or "destination"
+
+    Returns:
+        Node object
+    """
+    node = nodes.get(dic[prefix + "_id"])
+
+    if node is None:
+        node = Node(id=dic[prefix + "_id"],
+                    name=dic[prefix + "_name"],
+                    description=dic[prefix + "_description"],
+                    lat=dic[prefix + "_lat"],
+                    long=dic[prefix + "_long"],
+                    type=dic[prefix + "_type"])
+        nodes[node.id] = node
+
+    return node
+
+
+def serialize(o):
+    """
+    Returns a JSON-serializable version of a Node or Edge object, pass it to json.dumps as default
+    """
+    return o.toDict()
+
         
 class Graph:
-    adjacency_list = {}
-    
     def __init__(self, data):
         """
         Constructor for Graph object. Pass in a list of dictionaries that represents the adjacency list.
+        The adjacency list belongs to this instance so that a rebuilt graph never shares state with the old one.
 
         Arguments:
             data -- list of dict representing the adjacency list
         """
+        self.adjacency_list = {}
+        
+        # the same edges keyed by destination, used by searches that run backwards from the destination
+        self.reverse_list = {}
+        
+        # one Node object per id, shared by every edge leaving or arriving at it
+        nodes = {}
         
         for dic in data:
-            source_node = Node(id=dic["source_id"],
-                               name=dic["source_name"],
-                               description=dic["source_description"],
-                               lat=dic["source_lat"],
-                               long=dic["source_long"],
-                               type=dic["source_type"])
-            dest_node = Node(id=dic["destination_id"],
-                             name=dic["destination_name"],
-                             description=dic["destination_description"],
-                             lat=dic["destination_lat"],
-                             long=dic["destination_long"],
-                             type=dic["destination_type"])
+            source_node = rowNode(nodes, dic, "source")
+            dest_node = rowNode(nodes, dic, "destination")
             edge = Edge(source=source_node,
                         destination=dest_node,
                         distance=dic["distance"],
@@ -231,13 +302,20 @@ class Graph:
             None
         """
         if (edge.source in self.adjacency_list):
-            if not self.isNeighbour(edge.source, edge.destination):
-                self.adjacency_list[edge.source].append(edge)
+            if self.isNeighbour(edge.source, edge.destination):
+                return
+            
+            self.adjacency_list[edge.source].append(edge)
                 
         else:
             self.adjacency_list[edge.source] = []
             self.adjacency_list[edge.source].append(edge)
             
+        if edge.destination not in self.reverse_list:
+            self.reverse_list[edge.destination] = []
+            
+        self.reverse_list[edge.destination].append(edge)
+            
     def vertices(self) -> list:
         """
         Returns a list of id representing all possible sources in the adjacency list
@@ -270,7 +348,555 @@ class Graph:
             return []
         
         return self.adjacency_list[source]
-                
+    
+    def radj(self, destination: Node) -> list:
+        """
+        Returns a list of edges that end at the destination node. The edges keep their original direction,
+        so edge.source is the neighbour.
+        If destination node is not in the reverse adjacency list, will return an empty list
+
+        Returns:
+            List of all edge objects arriving at the destination node
+            Empty list if destination node not in reverse adjacency list
+        """
+        if destination not in self.reverse_list:
+            return []
+        
+        return self.reverse_list[destination]
+
+
+class CompactGraph:
+    """
+    Array-backed alternative to Graph using the compressed sparse row (CSR) layout.
+    Node ids are interned to dense integers and every edge is stored as one slot in four flat arrays,
+    so no Edge objects are kept in memory:
+        offsets   -- edges leaving node i are stored at positions offsets[i] to offsets[i + 1] - 1
+        targets   -- integer index of the destination node
+        distances -- distance of the edge
+        codes     -- index into services, which holds the interned (type, bus_service) pairs
+    Each distinct node is stored once as a Node object in nodes.
+    A reverse view is kept in two more arrays: edges arriving at node i are listed in roffsets[i] to
+    roffsets[i + 1] - 1 of rsources (their source index) and rpositions (their slot in the forward arrays).
+
+    The graph is built from the same rows as Graph and keeps the same rule of one edge per
+    source and destination pair. adj() still returns Edge objects so the Algorithm classes can
+    run on either graph; an Edge object is created the first time its slot is asked for and kept,
+    so later calls do not allocate. Dijkstra and IanAStar search the raw arrays directly, and
+    neighbours() walks them without creating any objects.
+    """
+    def __init__(self, data=None):
+        """
+        Constructor for CompactGraph object. Pass in a list of dictionaries that represents the adjacency list.
+
+        Arguments:
+            data -- list of dict representing the adjacency list, as returned by Database.select_adj_list,
+                    None for an empty graph (snapshot.load fills the arrays in directly)
+        """
+        self.nodes = []
+        self.index = {}
+        self.services = []
+        service_index = {}
+
+        # Edge objects already handed out, by position in the arrays
+        self.cache = {}
+
+        # group edges by source index first, dropping repeated source and destination pairs like Graph does
+        grouped = []
+        seen = set()
+
+        for dic in data or []:
+            source = self.__intern(dic, "source")
+            destination = self.__intern(dic, "destination")
+
+            while len(grouped) < len(self.nodes):
+                grouped.append([])
+
+            if (source, destination) in seen:
+                continue
+            seen.add((source, destination))
+
+            service = (dic["edge_type"], dic["bus_service"])
+            if service not in service_index:
+                service_index[service] = len(self.services)
+                self.services.append(service)
+
+            grouped[source].append((destination, dic["distance"], service_index[service]))
+
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        self.distances = array("d")
+        self.codes = array("l")
+
+        for edges in grouped:
+            for destination, distance, code in edges:
+                self.targets.append(destination)
+                self.distances.append(distance)
+                self.codes.append(code)
+            self.offsets.append(len(self.targets))
+
+        # reverse view, counting sort of the forward slots by target
+        self.roffsets = array("l", [0] * (len(self.nodes) + 1))
+        for target in self.targets:
+            self.roffsets[target + 1] += 1
+        for index in range(len(self.nodes)):
+            self.roffsets[index + 1] += self.roffsets[index]
+
+        self.rsources = array("l", [0] * len(self.targets))
+        self.rpositions = array("l", [0] * len(self.targets))
+        fill = array("l", self.roffsets[:-1])
+
+        for source in range(len(self.nodes)):
+            for position in range(self.offsets[source], self.offsets[source + 1]):
+                slot = fill[self.targets[position]]
+                self.rsources[slot] = source
+                self.rpositions[slot] = position
+                fill[self.targets[position]] += 1
+
+    def __intern(self, dic, prefix) -> int:
+        """
+        Returns the dense integer index of the node described by the source_* or destination_* fields
+        of an adjacency list row, adding the node to the graph if it has not been seen before.
+        """
+        id = dic[prefix + "_id"]
+
+        if id not in self.index:
+            self.index[id] = len(self.nodes)
+            self.nodes.append(Node(id=id,
+                                   name=dic[prefix + "_name"],
+                                   description=dic[prefix + "_description"],
+                                   lat=dic[prefix + "_lat"],
+                                   long=dic[prefix + "_long"],
+                                   type=dic[prefix + "_type"]))
+
+        return self.index[id]
+
+    def __repr__(self) -> str:
+        """
+        Returns a string representation of this object.
+        """
+        return "CompactGraph({} nodes, {} edges)".format(len(self.nodes), len(self.targets))
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def indexOf(self, node) -> int:
+        """
+        Returns the dense integer index of a node.
+
+        Arguments:
+            node -- Node object or string id of the node
+
+        Returns:
+            int index of the node, None if the node is not in the graph
+        """
+        return self.index.get(node.id if isinstance(node, Node) else node)
+
+    def neighbours(self, index: int):
+        """
+        Iterate over the raw edges leaving a node without creating Edge objects.
+
+        Arguments:
+            index -- dense integer index of the source node
+
+        Returns:
+            Iterator of (target index, distance, service code) tuples
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return zip(self.targets[start:end], self.distances[start:end], self.codes[start:end])
+
+    def rneighbours(self, index: int):
+        """
+        Iterate over the raw edges arriving at a node without creating Edge objects.
+
+        Arguments:
+            index -- dense integer index of the destination node
+
+        Returns:
+            Iterator of (source index, distance, service code) tuples
+        """
+        start, end = self.roffsets[index], self.roffsets[index + 1]
+        return ((self.rsources[slot], self.distances[self.rpositions[slot]], self.codes[self.rpositions[slot]])
+                for slot in range(start, end))
+
+    def edge(self, source: int, position: int) -> Edge:
+        """
+        Returns the edge stored at a position in the arrays as an Edge object, created on first use and kept.
+
+        Arguments:
+            source   -- dense integer index of the source node
+            position -- position of the edge in the targets/distances/codes arrays
+
+        Returns:
+            Edge object
+        """
+        edge = self.cache.get(position)
+
+        if edge is None:
+            type, bus_service = self.services[self.codes[position]]
+            edge = Edge(source=self.nodes[source],
+                        destination=self.nodes[self.targets[position]],
+                        distance=self.distances[position],
+                        bus_service=bus_service,
+                        type=type)
+            self.cache[position] = edge
+
+        return edge
+
+    def vertices(self) -> list:
+        """
+        Returns a list of all Node objects in the graph
+        """
+        return list(self.nodes)
+
+    def edges(self) -> list:
+        return [self.adj(node) for node in self.nodes]
+
+    def adj(self, source) -> list:
+        """
+        Returns a list edges that are adjacent to the source node.
+        If source node is not in the graph, will return an empty list
+
+        Arguments:
+            source -- Node object or string id of the source node
+
+        Returns:
+            List of all edge objects adjacent to the source node
+            Empty list if source node not in the graph
+        """
+        index = self.indexOf(source)
+
+        if index is None:
+            return []
+
+        return [self.edge(index, position) for position in range(self.offsets[index], self.offsets[index + 1])]
+
+    def radj(self, destination) -> list:
+        """
+        Returns a list of edges that end at the destination node. The edges keep their original direction,
+        so edge.source is the neighbour.
+
+        Arguments:
+            destination -- Node object or string id of the destination node
+
+        Returns:
+            List of all edge objects arriving at the destination node
+            Empty list if destination node not in the graph
+        """
+        index = self.indexOf(destination)
+
+        if index is None:
+            return []
+
+        return [self.edge(self.rsources[slot], self.rpositions[slot])
+                for slot in range(self.roffsets[index], self.roffsets[index + 1])]
+
+
+class LazyGraph:
+    """
+    Graph that reads the edges of a node from the database the first time they are needed, for networks
+    too large to load with select_adj_list. Only the blocks of recently used nodes are kept, in a bounded
+    least-recently-used cache, so memory follows the part of the network a search explores.
+
+    The edges come from the adjacency view (migration 2 in db.py), one indexed lookup per block, in the
+    same order as select_adj_list and with the same rule of one edge per source and destination pair.
+    adj() and radj() return Edge objects like Graph, so the Algorithm classes run on it unchanged.
+    To serve it, pass the class as the loader: GraphStore(database, loader=LazyGraph).
+    """
+    def __init__(self, database, capacity: int = 4096):
+        """
+        Constructor for LazyGraph object. Nothing is read until the first lookup.
+
+        Arguments:
+            database -- Database object to read the edges from
+            capacity -- number of adjacency blocks to keep, each block being the edges leaving or
+                        arriving at one node
+        """
+        self.database = database
+        self.capacity = capacity
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Node objects of the cached blocks, shared between blocks and dropped with the last block using them
+        self.nodes = weakref.WeakValueDictionary()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self) -> str:
+        """
+        Returns a string representation of this object.
+        """
+        return "LazyGraph({} of {} blocks cached)".format(len(self.blocks), self.capacity)
+
+    def __block(self, column: str, id) -> list:
+        """
+        Returns the edges whose column ("source_id" or "destination_id") is id, reading them on a cache miss.
+        """
+        key = (column, id)
+
+        with self.lock:
+            if key in self.blocks:
+                self.blocks.move_to_end(key)
+                self.hits += 1
+                return self.blocks[key]
+
+            self.misses += 1
+
+        # reading outside the lock, two threads may fetch the same block but neither waits on the other
+        rows = self.database.select_many("SELECT * FROM adjacency WHERE {} = ?".format(column), (id,))
+        edges = []
+        seen = set()
+
+        for dic in rows:
+            if (dic["source_id"], dic["destination_id"]) in seen:
+                continue
+            seen.add((dic["source_id"], dic["destination_id"]))
+
+            edges.append(Edge(source=rowNode(self.nodes, dic, "source"),
+                              destination=rowNode(self.nodes, dic, "destination"),
+                              distance=dic["distance"],
+                              bus_service=dic["bus_service"],
+                              type=dic["edge_type"]))
+
+        with self.lock:
+            self.blocks[key] = edges
+            self.blocks.move_to_end(key)
+
+            while len(self.blocks) > self.capacity:
+                self.blocks.popitem(last=False)
+                self.evictions += 1
+
+        return edges
+
+    def vertices(self) -> list:
+        """
+        Returns a list of all Node objects that have an edge leaving them.
+        This reads every such node, but none of their edges.
+        """
+        return [Node(data=row) for row in self.database.select_many('''SELECT * FROM nodes WHERE id IN
+                                                                           (SELECT edge.source FROM edge
+                                                                            JOIN nodes n2 ON n2.id = edge.destination)''')]
+
+    def edges(self) -> list:
+        return [self.adj(node) for node in self.vertices()]
+
+    def adj(self, source) -> list:
+        """
+        Returns a list edges that are adjacent to the source node.
+        If source node is not in the graph, will return an empty list
+
+        Arguments:
+            source -- Node object or string id of the source node
+
+        Returns:
+            List of all edge objects adjacent to the source node
+            Empty list if source node not in the graph
+        """
+        return self.__block("source_id", source.id if isinstance(source, Node) else source)
+
+    def radj(self, destination) -> list:
+        """
+        Returns a list of edges that end at the destination node. The edges keep their original direction,
+        so edge.source is the neighbour.
+
+        Arguments:
+            destination -- Node object or string id of the destination node
+
+        Returns:
+            List of all edge objects arriving at the destination node
+            Empty list if destination node not in the graph
+        """
+        return self.__block("destination_id", destination.id if isinstance(destination, Node) else destination)
+
+    def clear(self) -> None:
+        """
+        Drop every cached block. The counters are kept.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.blocks.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters and the current size as a dict
+        """
+        return {"size": len(self.blocks),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+
+class OverlayGraph:
+    """
+    Edges and nodes added or removed at runtime, layered over the graph they were changed in, so a change
+    does not require rebuilding the whole graph. The base graph (Graph, CompactGraph or LazyGraph) is never
+    modified; adj() and radj() return its edges minus the removed ones plus the added ones, and nodes that
+    no change touched are answered by the base graph directly.
+
+    A graph being served may be in use by other requests, so changes are made to a copy() that is then
+    swapped in. Copying only copies the changes, not the base graph.
+    Nodes are passed through to the base graph as they are, so a Graph base needs Node objects, not ids.
+
+    Every source and destination pair a change touched is masked in the base graph, whether the edge was
+    added or removed, and only the overlay's own edges are returned for it. A LazyGraph base reads blocks
+    from the database the change was written to, so it may or may not already include the change.
+    """
+    def __init__(self, base):
+        """
+        Constructor for OverlayGraph object, starting with no changes.
+
+        Arguments:
+            base -- graph object the changes are layered over
+        """
+        self.base = base
+        self.added = {}          # source id -> list of added Edge objects
+        self.radded = {}         # destination id -> list of added Edge objects
+        self.removed = set()     # (source id, destination id) of base edges that were removed or replaced
+        self.touched = set()     # ids of sources with a masked pair
+        self.rtouched = set()    # ids of destinations with a masked pair
+
+    def __repr__(self) -> str:
+        """
+        Returns a string representation of this object.
+        """
+        return "OverlayGraph({}, {} added, {} removed)".format(self.base, sum(len(edges) for edges in self.added.values()), len(self.removed))
+
+    def copy(self):
+        """
+        Returns a new OverlayGraph over the same base graph with the same changes.
+        """
+        graph = OverlayGraph(self.base)
+        graph.added = {id: list(edges) for id, edges in self.added.items()}
+        graph.radded = {id: list(edges) for id, edges in self.radded.items()}
+        graph.removed = set(self.removed)
+        graph.touched = set(self.touched)
+        graph.rtouched = set(self.rtouched)
+        return graph
+
+    @staticmethod
+    def key(node):
+        """
+        Returns the id of a Node object, or the value itself if it is already an id
+        """
+        return node.id if isinstance(node, Node) else node
+
+    def addEdge(self, edge) -> None:
+        """
+        Add an Edge object to the graph. Like Graph, only one edge is kept per source and destination pair,
+        so the caller should remove an existing edge first.
+
+        Arguments:
+            edge -- Edge object to add to the graph
+
+        Returns:
+            None
+        """
+        self.mask(edge.source.id, edge.destination.id)
+        self.added.setdefault(edge.source.id, []).append(edge)
+        self.radded.setdefault(edge.destination.id, []).append(edge)
+
+    def mask(self, source, destination) -> None:
+        """
+        Hide the base graph's edge between two node ids, if it has one.
+        """
+        self.removed.add((source, destination))
+        self.touched.add(source)
+        self.rtouched.add(destination)
+
+    def removeEdge(self, source, destination):
+        """
+        Remove the edge between two nodes.
+
+        Arguments:
+            source      -- Node object of the source node
+            destination -- Node object of the destination node
+
+        Returns:
+            The Edge object that was removed, None if there was no such edge
+        """
+        for edge in self.added.get(source.id, []):
+            if edge.destination.id == destination.id:
+                self.added[source.id].remove(edge)
+                self.radded[destination.id].remove(edge)
+                return edge
+
+        if (source.id, destination.id) in self.removed:
+            return None
+
+        for edge in self.base.adj(source):
+            if edge.destination.id == destination.id:
+                self.mask(source.id, destination.id)
+                return edge
+
+        return None
+
+    def vertices(self) -> list:
+        """
+        Returns a list of all Node objects that have an edge leaving them
+        """
+        vertices = list(self.base.vertices())
+        ids = set(node.id for node in vertices)
+
+        for id, edges in self.added.items():
+            if edges and id not in ids:
+                vertices.append(edges[0].source)
+
+        return vertices
+
+    def edges(self) -> list:
+        return [self.adj(node) for node in self.vertices()]
+
+    def adj(self, source) -> list:
+        """
+        Returns a list edges that are adjacent to the source node.
+        If source node is not in the graph, will return an empty list
+
+        Arguments:
+            source -- Node object or string id of the source node
+
+        Returns:
+            List of all edge objects adjacent to the source node
+            Empty list if source node not in the graph
+        """
+        id = OverlayGraph.key(source)
+        edges = self.base.adj(source)
+
+        if id in self.touched:
+            edges = [edge for edge in edges if (id, edge.destination.id) not in self.removed]
+
+        if id in self.added:
+            edges = edges + self.added[id]
+
+        return edges
+
+    def radj(self, destination) -> list:
+        """
+        Returns a list of edges that end at the destination node. The edges keep their original direction,
+        so edge.source is the neighbour.
+
+        Arguments:
+            destination -- Node object or string id of the destination node
+
+        Returns:
+            List of all edge objects arriving at the destination node
+            Empty list if destination node not in the graph
+        """
+        id = OverlayGraph.key(destination)
+        edges = self.base.radj(destination)
+
+        if id in self.rtouched:
+            edges = [edge for edge in edges if (edge.source.id, id) not in self.removed]
+
+        if id in self.radded:
+            edges = edges + self.radded[id]
+
+        return edges
+
+
 class PQItem:
     """
     Generic object that will work with whatever
@@ -308,6 +934,18 @@ class PriorityQueue(ABC):
     def isEmpty(self):
         pass
     
+    def decreaseKey(self, element, priority) -> None:
+        """
+        Lower the priority of an element, or add it if it is not in the queue.
+        Queues that cannot locate an element cheaply just push it again; the old entry is left
+        behind and has to be skipped by the caller when it is popped.
+
+        Arguments:
+            element  -- the element whose priority changed
+            priority -- the new, lower priority
+        """
+        self.push(PQItem(priority, element))
+    
 class ListPriorityQueue(PriorityQueue):
     """
     Basic priority queue implementation using a list.
@@ -347,9 +985,11 @@ class ListPriorityQueue(PriorityQueue):
         
         pivot = queue[len(queue) // 2]
         left = [e for e in queue if e < pivot]
+        middle = [e for e in queue if not (e < pivot) and not (e > pivot)]
         right = [e for e in queue if e > pivot]
         
-        return self.__quickSort(left) + [pivot] + self.__quickSort(right)
+        # elements with the same priority as the pivot must be kept, not just the pivot itself
+        return self.__quickSort(left) + middle + self.__quickSort(right)
     
     
 class MinHeap(PriorityQueue):
@@ -367,7 +1007,7 @@ class MinHeap(PriorityQueue):
         
         size: int = self.len()
         
-        while (self.at(size) < self.atParent(size)):
+        while (size > 1) and (self.at(size) < self.atParent(size)):
             self.swap(size, self.parent(size))
             size = self.parent(size)
         
@@ -388,10 +1028,10 @@ class MinHeap(PriorityQueue):
         return result
      
     def isEmpty(self) -> bool:
-        return self.len() == 1
+        return self.len() == 0
     
     def getMin(self):
-        return self.heap[1]
+        return None if self.isEmpty() else self.heap[1]
     
     def contains(self, node) -> bool:
         return node in self.heap
@@ -422,7 +1062,7 @@ class MinHeap(PriorityQueue):
         return index + index + 1
     
     def isLeaf(self, index: int) -> bool:
-        return ((index <= self.len())) and (index >= self.len() // 2)
+        return ((index <= self.len())) and (index > self.len() // 2)
             
     def swap(self, first: int, second: int) -> None:
         self.heap[first], self.heap[second] = self.heap[second], self.heap[first]
@@ -432,17 +1072,21 @@ class MinHeap(PriorityQueue):
         if self.isLeaf(index):
             return
         
-        # nothing to heapify if the element is less than both its child
-        if (self.at(index) < self.atLeft(index)) and (self.at(index) < self.atRight(index)):
-            return
+        # pick the smallest of the element and its children, a missing right child is ignored
+        smallest = index
         
-        if (self.atLeft(index) < self.atRight(index)):
-            self.swap(index, self.left(index))
-            self.heapify(self.left(index))
+        if self.at(self.left(index)) < self.at(smallest):
+            smallest = self.left(index)
             
-        else:
-            self.swap(index, self.right(index))
-            self.heapify(self.right(index))
+        if (self.atRight(index) is not None) and (self.at(self.right(index)) < self.at(smallest)):
+            smallest = self.right(index)
+        
+        # nothing to heapify if the element is not larger than either child
+        if smallest == index:
+            return
+        
+        self.swap(index, smallest)
+        self.heapify(smallest)
         
     def heapifyAll(self) -> None:
         index: int = self.len() // 2
@@ -455,6 +1099,112 @@ class MinHeap(PriorityQueue):
         return len(self.heap) - 1
 
 
+class IndexedMinHeap(PriorityQueue):
+    """
+    Binary MinHeap that also remembers where every element sits in the heap.
+    The position dict makes contains O(1) and lets decreaseKey move an element up in place
+    in O(log n), so each element is in the queue at most once. 0-based indexing is used.
+    """
+    def __init__(self) -> None:
+        self.heap = []
+        self.position = {}
+        
+    def push(self, element: PQItem) -> None:
+        "Adds a new element into the heap, or lowers its priority if it is already in the heap"
+        if element.element in self.position:
+            self.decreaseKey(element.element, element.priority)
+            return
+        
+        self.heap.append(element)
+        self.position[element.element] = len(self.heap) - 1
+        self.siftUp(len(self.heap) - 1)
+        
+    def pop(self):
+        "Remove and returns the min element from the heap"
+        if self.isEmpty():
+            return None
+        
+        result = self.heap[0]
+        last = self.heap.pop()
+        del self.position[result.element]
+        
+        if self.heap:
+            self.heap[0] = last
+            self.position[last.element] = 0
+            self.siftDown(0)
+            
+        return result
+    
+    def decreaseKey(self, element, priority) -> None:
+        """
+        Lower the priority of an element already in the heap, or add it if it is not.
+        Nothing happens if the new priority is not lower than the current one.
+
+        Arguments:
+            element  -- the element whose priority changed
+            priority -- the new, lower priority
+        """
+        if element not in self.position:
+            self.push(PQItem(priority, element))
+            return
+        
+        index = self.position[element]
+        
+        if priority < self.heap[index].priority:
+            self.heap[index].priority = priority
+            self.siftUp(index)
+    
+    def isEmpty(self) -> bool:
+        return len(self.heap) == 0
+    
+    def getMin(self):
+        return None if self.isEmpty() else self.heap[0]
+    
+    def contains(self, element) -> bool:
+        return element in self.position
+    
+    def priority(self, element):
+        "Returns the current priority of an element, None if it is not in the heap"
+        return self.heap[self.position[element]].priority if element in self.position else None
+    
+    def swap(self, first: int, second: int) -> None:
+        self.heap[first], self.heap[second] = self.heap[second], self.heap[first]
+        self.position[self.heap[first].element] = first
+        self.position[self.heap[second].element] = second
+    
+    def siftUp(self, index: int) -> None:
+        while index > 0:
+            parent = (index - 1) // 2
+            
+            if not (self.heap[index] < self.heap[parent]):
+                return
+            
+            self.swap(index, parent)
+            index = parent
+    
+    def siftDown(self, index: int) -> None:
+        size = len(self.heap)
+        
+        while True:
+            smallest = index
+            left, right = 2 * index + 1, 2 * index + 2
+            
+            if left < size and self.heap[left] < self.heap[smallest]:
+                smallest = left
+                
+            if right < size and self.heap[right] < self.heap[smallest]:
+                smallest = right
+            
+            if smallest == index:
+                return
+            
+            self.swap(index, smallest)
+            index = smallest
+
+    def len(self) -> int:
+        return len(self.heap)
+
+
 class BSTPriorityQueue(PriorityQueue):
     
     class BSTNode(PQItem):
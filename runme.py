@@ -10,12 +10,160 @@ for module in ["flask", "json"]:
         
 import flask
 import json
+import os
+import hmac
+from math import isfinite
 import db
 from algorithms import *
 from objects import *
+from store import GraphStore
+from hierarchy import ContractionHierarchy, CHDijkstra
+from landmarks import Landmarks, ALTAStar
+from cache import LRUCache, TreeCache
+from spatial import GridIndex
+from editor import GraphEditor
+import snapshot
 
 app = flask.Flask(__name__)
 db = db.Database()
+# the graph is memory-mapped from a binary snapshot, which is rewritten whenever the database changes;
+# Dijkstra, AStar and IanAStar search its arrays directly, and the other searches reuse the Edge objects adj() keeps
+store = GraphStore(db, loader=snapshot.loader("./static/data/map.graph"))
+
+# operator changes made through the admin API, applied to the served graph without rebuilding it
+editor = GraphEditor(store, db)
+
+# responses of the routing endpoints, keyed by (source, destination, algorithm, graph version), see route_entry
+routes = LRUCache(maxsize=4096, ttl=3600)
+store.onReload(lambda version, graph: routes.clear())
+
+# complete shortest-path trees of recently used sources, answering any destination without a new search
+trees = TreeCache()
+store.onReload(lambda version, graph: trees.clear())
+
+# search algorithms that can be picked with ?algorithm= on the routing endpoints
+searches = {"dijkstra": Dijkstra,
+            "astar": AStar,
+            "bidirectional": BidirectionalDijkstra,
+            "bidirectional-astar": BidirectionalAStar,
+            "alt": ALTAStar,
+            "transfers": IanAStar,
+            "ch": CHDijkstra,
+            "tree": Dijkstra}
+
+# priority queues that can be picked with ?queue= on the routing endpoints
+queues = {"indexed": IndexedMinHeap,
+          "heap": MinHeap,
+          "list": ListPriorityQueue}
+
+# most alternative routes that can be asked for with ?k=, every extra route costs a round of spur searches
+MAX_K = 10
+
+def find_path(algorithm, source, destination, queue) -> list:
+    """
+    Run the chosen algorithm, handing it the preprocessed data it needs, and return its path.
+    The contraction hierarchy and the landmarks are built the first time they are needed for each graph version.
+    "tree" answers from the cached shortest-path tree of the source.
+    """
+    if algorithm == "tree":
+        version, graph = store.current()
+        return trees.get(source, graph, version).pathTo(destination)
+    
+    if algorithm == "ch":
+        hierarchy = store.derived("hierarchy", lambda graph: ContractionHierarchy.loadOrBuild("./static/data/map.ch", graph))
+        return CHDijkstra(source, destination, hierarchy, queue).getPath()
+    
+    if algorithm == "alt":
+        return ALTAStar(source, destination, store.get(), queue, landmarks=store.derived("landmarks", Landmarks)).getPath()
+    
+    return searches[algorithm](source, destination, store.get(), queue).getPath()
+
+def route_entry(response, source, destination, paths, bound) -> dict:
+    """
+    Returns the routes cache entry of a response, with what carry_over needs to tell whether a change makes it stale.
+
+    Arguments:
+        response    -- serialized response
+        source      -- Node object the routes start at
+        destination -- Node object the routes end at
+        paths       -- list of the paths (lists of Edge objects) in the response
+        bound       -- a new route must be at most this long to change the response, float('inf') if any new route could
+    """
+    return {"response": response,
+            "source": source,
+            "destination": destination,
+            "edges": frozenset((edge.source.id, edge.destination.id) for path in paths for edge in path),
+            "bound": bound}
+
+def carry_over(version, graph, change, artifacts) -> None:
+    """
+    After a change from the admin API, keep the cached routes, shortest-path trees and derived objects it cannot have affected.
+    Removing an edge, or making it longer, can only affect the results that use it. A new or shorter edge (u, v) can only
+    give a shorter route from s to d if lower(s, u) + distance + lower(v, d) is within the cached route's length, lower
+    being the scaled straight-line distance A-Star uses; a shortest-path tree knows its exact distances to u and v.
+    """
+    inf = float('inf')
+    removed = set((edge.source.id, edge.destination.id) for edge in change["removed"])
+    replaced = {(edge.source.id, edge.destination.id): edge.distance for edge in change["removed"]}
+    shorter = [edge for edge in change["added"] if edge.distance < replaced.get((edge.source.id, edge.destination.id), inf)]
+    gone = set(node.id for node in change["nodes_removed"])
+    scale = AStar.admissibleScale(graph)
+    
+    def stale_route(entry) -> bool:
+        if entry["source"].id in gone or entry["destination"].id in gone or entry["edges"] & removed:
+            return True
+        
+        return any(scale * (entry["source"].distanceTo(edge.source, exact=True) + edge.destination.distanceTo(entry["destination"], exact=True))
+                   + edge.distance <= entry["bound"] for edge in shorter)
+    
+    def stale_tree(tree) -> bool:
+        if tree.source.id in gone:
+            return True
+        
+        for edge in change["removed"]:
+            used = tree.edgeTo.get(edge.destination)
+            
+            if used is not None and used.source.id == edge.source.id:
+                return True
+            
+        return any(edge.source in tree.distance and tree.distance[edge.source] + edge.distance < tree.distance.get(edge.destination, inf)
+                   for edge in shorter)
+    
+    routes.rekey(lambda key, entry: key[:-1] + (version,) if key[-1] == version - 1 and not stale_route(entry) else None)
+    trees.rekey(version, stale_tree)
+    
+    if "spatial" in artifacts:
+        for node in change["nodes_removed"]:
+            artifacts["spatial"].remove(node)
+            
+        for node in change["nodes_added"]:
+            artifacts["spatial"].add(node)
+    
+    # the hierarchy is rebuilt after any edge change, landmark bounds stay valid while distances only grow
+    if removed or shorter:
+        artifacts.pop("hierarchy", None)
+    
+    if shorter:
+        artifacts.pop("landmarks", None)
+
+store.onUpdate(carry_over)
+
+def spatial_index() -> GridIndex:
+    """
+    Returns the spatial index over the nodes table, built once per graph version.
+    """
+    return store.derived("spatial", lambda graph: GridIndex([Node(data=row) for row in db.select_many("SELECT * FROM nodes")]))
+
+def coordinate(value) -> float:
+    """
+    Returns a query parameter as a float, raising ValueError unless it is a finite number
+    """
+    number = float(value)
+    
+    if not isfinite(number):
+        raise ValueError("{} is not finite".format(value))
+    
+    return number
 
 @app.route("/")
 def main_page():
@@ -25,9 +173,39 @@ def main_page():
 def all_nodes():
     return json.dumps(db.select_many("SELECT * FROM nodes ORDER BY name"))
 
+@app.route("/api/nodes/nearest", methods=["GET"])
+def nearest_nodes():
+    """
+    The ?k= nodes closest to ?lat=&long=, nearest first, each with its distance in kilometers.
+    """
+    try:
+        lat = coordinate(flask.request.args.get("lat", ""))
+        long = coordinate(flask.request.args.get("long", ""))
+        k = int(flask.request.args.get("k", "1"))
+        
+    except ValueError:
+        return {"Error": "Expected lat, long and k"}
+    
+    result = [dict(node.toDict(), distance=distance) for node, distance in spatial_index().nearest(lat, long, k)]
+    return json.dumps(result)
+
+@app.route("/api/nodes/bbox", methods=["GET"])
+def bbox_nodes():
+    """
+    Every node inside ?south=&west=&north=&east=, ordered by name.
+    """
+    try:
+        bounds = [coordinate(flask.request.args.get(name, "")) for name in ("south", "west", "north", "east")]
+        
+    except ValueError:
+        return {"Error": "Expected south, west, north and east"}
+    
+    result = sorted((node.toDict() for node in spatial_index().bbox(*bounds)), key=lambda node: node["name"])
+    return json.dumps(result)
+
 @app.route("/api/nodes/id/<id>", methods=["GET"])
 def id_nodes(id):
-    data = db.select_one("SELECT * FROM nodes WHERE id = '{}'".format(id))
+    data = db.select_one("SELECT * FROM nodes WHERE id = ?", (id,))
     
     if data is None:
         return {"Error": "Node not found"}
@@ -36,15 +214,273 @@ def id_nodes(id):
 
 @app.route("/api/path/<source>/<destination>", methods=["GET"])
 def get_path(source, destination):
+    """
+    Shortest route between two nodes as a list of edges.
+    With ?k=N (1 < N <= MAX_K) the N shortest loopless routes are returned instead, as [{"distance", "path"}, ...].
+    """
+    algorithm = flask.request.args.get("algorithm", "dijkstra")
+    queue = flask.request.args.get("queue", "indexed")
+    k = flask.request.args.get("k", "1")
+    
+    if algorithm not in searches:
+        return {"Error": "Unknown algorithm"}
+    
+    if queue not in queues:
+        return {"Error": "Unknown queue"}
+    
+    if not k.isdigit() or int(k) < 1:
+        return {"Error": "Expected k to be a positive integer"}
+    
+    if int(k) > MAX_K:
+        return {"Error": "Expected k to be at most {}".format(MAX_K)}
+    
+    k = int(k)
+    key = (source, destination, algorithm if k == 1 else "yen:{}".format(k), store.version)
+    cached = routes.get(key)
+    
+    if cached is not None:
+        return cached["response"]
+    
     source = db.select_node(id=source)
     destination = db.select_node(id=destination)
-    adj_list = db.select_adj_list()
-    a = Dijkstra(source, destination, Graph(data=adj_list), ListPriorityQueue())
-    result = a.getPath()
+    
+    if source is None or destination is None:
+        return {"Error": "Node not found"}
+    
+    if k > 1:
+        result = YenKShortest(source, destination, store.get(), queues[queue](), k=k).getPaths()
+    else:
+        result = find_path(algorithm, source, destination, queues[queue]())
     
     if result == []:
         return {"Error": "No possible routes"}
     
-    return json.dumps(result, default=lambda o: o.__dict__)
+    response = json.dumps(result, default=serialize)
+    
+    if k > 1:
+        # a new route only changes the answer if it beats the k-th route
+        bound = max(route["distance"] for route in result) if len(result) == k else float('inf')
+        routes.put(key, route_entry(response, source, destination, [route["path"] for route in result], bound))
+    else:
+        # "transfers" minimizes more than the distance, so any new route could change its answer
+        bound = float('inf') if algorithm == "transfers" else sum(edge.distance for edge in result)
+        routes.put(key, route_entry(response, source, destination, [result], bound))
+    
+    return response
+
+@app.route("/api/path/batch", methods=["POST"])
+def get_path_batch():
+    """
+    Route many pairs in one request. The body is {"pairs": [{"source": id, "destination": id}, ...]}.
+    All nodes are looked up in one query and pairs are grouped by source, so each distinct source is searched
+    once and its shortest-path tree answers all of its destinations.
+    Returns one entry per pair, in the same order, holding either the path or an error.
+    """
+    body = flask.request.get_json(silent=True) or {}
+    pairs = body.get("pairs")
+    
+    if not isinstance(pairs, list) or not all(isinstance(pair, dict) for pair in pairs):
+        return {"Error": "Expected {\"pairs\": [{\"source\": id, \"destination\": id}, ...]}"}
+    
+    pairs = [(str(pair.get("source")), str(pair.get("destination"))) for pair in pairs]
+    nodes = db.select_nodes([id for pair in pairs for id in pair])
+    version, graph = store.current()
+    
+    grouped = {}
+    for index, (source, destination) in enumerate(pairs):
+        grouped.setdefault(source, []).append((index, destination))
+    
+    result = [None] * len(pairs)
+    
+    for source, destinations in grouped.items():
+        tree = trees.get(nodes[source], graph, version) if source in nodes else None
+        
+        for index, destination in destinations:
+            entry = {"source": source, "destination": destination}
+            
+            if tree is None or destination not in nodes:
+                entry["Error"] = "Node not found"
+            else:
+                entry["path"] = tree.pathTo(nodes[destination])
+                
+                if entry["path"] == []:
+                    del entry["path"]
+                    entry["Error"] = "No possible routes"
+                    
+            result[index] = entry
+    
+    return json.dumps(result, default=serialize)
+
+@app.route("/api/matrix", methods=["GET", "POST"])
+def get_matrix():
+    """
+    Shortest-path distances from N origins to M destinations.
+    GET takes ?origins=id,id&destinations=id,id&transfers=1, POST takes the same as a JSON body with lists of ids.
+    One search per origin settles all of its destinations. The distances come back as one flat row-major
+    list with its shape, null where there is no route; with transfers, the number of transfers on each
+    of those routes comes back the same way.
+    """
+    if flask.request.method == "POST":
+        body = flask.request.get_json(silent=True) or {}
+        origins, destinations = body.get("origins", []), body.get("destinations", [])
+        
+        if not all(isinstance(ids, list) and all(isinstance(id, (str, int)) for id in ids) for ids in (origins, destinations)):
+            return {"Error": "Expected {\"origins\": [id, ...], \"destinations\": [id, ...]}"}
+        
+        origins = [str(id) for id in origins]
+        destinations = [str(id) for id in destinations]
+        with_transfers = bool(body.get("transfers", False))
+    else:
+        origins = [id for id in flask.request.args.get("origins", "").split(",") if id]
+        destinations = [id for id in flask.request.args.get("destinations", "").split(",") if id]
+        with_transfers = flask.request.args.get("transfers", "0") not in ("0", "false", "")
+    
+    if not origins or not destinations:
+        return {"Error": "Expected origins and destinations"}
+    
+    nodes = db.select_nodes(origins + destinations)
+    missing = [id for id in origins + destinations if id not in nodes]
+    
+    if missing:
+        return {"Error": "Node not found", "ids": sorted(set(missing))}
+    
+    graph = store.get()
+    targets = [nodes[id] for id in destinations]
+    distances = []
+    transfers = []
+    
+    for origin in origins:
+        search = OneToManyDijkstra(nodes[origin], targets, graph)
+        
+        for target in targets:
+            distances.append(search.distance.get(target) if target in search.settled else None)
+            
+            if with_transfers:
+                transfers.append(ParetoSearch.countTransfers(search.pathTo(target)) if target in search.settled else None)
+    
+    result = {"origins": origins,
+              "destinations": destinations,
+              "shape": [len(origins), len(destinations)],
+              "distances": distances}
+    
+    if with_transfers:
+        result["transfers"] = transfers
+    
+    return json.dumps(result)
+
+@app.route("/api/reachable/<source>", methods=["GET"])
+def get_reachable(source):
+    """
+    Every node reachable from source within ?max_km=, nearest first, with its distance.
+    ?types=Walk,Bus limits the search to those edge types.
+    """
+    source = db.select_node(id=source)
+    
+    if source is None:
+        return {"Error": "Node not found"}
+    
+    try:
+        max_km = float(flask.request.args.get("max_km", ""))
+        
+    except ValueError:
+        return {"Error": "Expected max_km"}
+    
+    types = flask.request.args.get("types")
+    types = [type for type in types.split(",") if type] if types else None
+    
+    search = BoundedDijkstra(source, max_km, store.get(), types=types)
+    result = [{"id": node.id,
+               "name": node.name,
+               "lat": node.lat,
+               "long": node.long,
+               "type": node.type,
+               "distance": distance} for node, distance in search.reachable()]
+    
+    return json.dumps(result)
+
+@app.route("/api/pareto/<source>/<destination>", methods=["GET"])
+def get_pareto(source, destination):
+    key = (source, destination, "pareto", store.version)
+    cached = routes.get(key)
+    
+    if cached is not None:
+        return cached["response"]
+    
+    source = db.select_node(id=source)
+    destination = db.select_node(id=destination)
+    
+    if source is None or destination is None:
+        return {"Error": "Node not found"}
+    
+    result = ParetoSearch(source, destination, store.get()).getFrontier()
+    
+    if result == []:
+        return {"Error": "No possible routes"}
+    
+    response = json.dumps(result, default=serialize)
+    routes.put(key, route_entry(response, source, destination, [route["path"] for route in result], float('inf')))
+    return response
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return {"version": store.version, "graph_version": db.graph_version(), "routes": routes.stats(), "trees": trees.stats()}
+
+def admin(change):
+    """
+    Run a change from the admin API. The API is disabled unless the MAP_ADMIN_TOKEN environment variable is set,
+    and every request must send the same token in the X-Admin-Token header.
+    """
+    token = os.environ.get("MAP_ADMIN_TOKEN")
+    
+    if not token:
+        return {"Error": "Admin API disabled"}
+    
+    if not hmac.compare_digest(flask.request.headers.get("X-Admin-Token", ""), token):
+        return {"Error": "Invalid admin token"}
+    
+    try:
+        version = change(flask.request.get_json(silent=True) or {})
+        
+    except ValueError as e:
+        return {"Error": str(e)}
+    
+    return {"version": version}
+
+@app.route("/api/admin/nodes", methods=["POST"])
+def admin_add_node():
+    """
+    Add a node, the body is {"id", "name", "description", "lat", "long", "type"}.
+    """
+    return admin(lambda body: editor.addNode(body))
+
+@app.route("/api/admin/nodes/<id>", methods=["DELETE"])
+def admin_remove_node(id):
+    """
+    Remove a node and all of its edges.
+    """
+    return admin(lambda body: editor.removeNode(id))
+
+@app.route("/api/admin/edges", methods=["POST"])
+def admin_add_edge():
+    """
+    Add an edge, the body is {"source", "destination", "distance", "bus_service", "type"}.
+    distance defaults to the straight-line distance, bus_service to "0" and type to "Walk".
+    """
+    return admin(lambda body: editor.addEdge(body.get("source"), body.get("destination"), body.get("distance"),
+                                             body.get("bus_service", "0"), body.get("type", "Walk")))
+
+@app.route("/api/admin/edges/<source>/<destination>", methods=["PATCH"])
+def admin_reweight_edge(source, destination):
+    """
+    Change the distance of an edge, the body is {"distance"}.
+    """
+    return admin(lambda body: editor.reweightEdge(source, destination, body.get("distance")))
+
+@app.route("/api/admin/edges/<source>/<destination>", methods=["DELETE"])
+def admin_remove_edge(source, destination):
+    """
+    Remove an edge.
+    """
+    return admin(lambda body: editor.removeEdge(source, destination))
 
 app.run()
\ No newline at end of file
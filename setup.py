@@ -29,10 +29,10 @@ sys.exit(1)
 
 
 import pip
-for module in ["flask", "json"]:
+for module in ["flask", "numpy"]:
     try:
         __import__(module)
         
     except ImportError:
         print("{} not installed, installing ...".format(module))
-        pip.main(["install", "flask"])
\ No newline at end of file
+        pip.main(["install", module])
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import sys
+import mmap
+import json
+import struct
+from objects import *
+
+# Binary snapshot of a CompactGraph. The file is written once by export and memory-mapped by load, and the
+# CSR arrays are used in place as memoryviews over the mapping, so loading does not parse or copy them and
+# every process that maps the same file shares its pages. Only the string table is decoded into Node objects.
+#
+# Layout, all little-endian, every section starting on an 8 byte boundary:
+#   header     -- MAGIC, FORMAT, graph version, modification time and size of the database (Database.signature),
+#                 node count, edge count, string table length
+#   offsets    -- int64 x (nodes + 1)
+#   targets    -- int64 x edges
+#   distances  -- float64 x edges
+#   codes      -- int64 x edges
+#   roffsets   -- int64 x (nodes + 1)
+#   rsources   -- int64 x edges
+#   rpositions -- int64 x edges
+#   lats       -- float64 x nodes
+#   longs      -- float64 x nodes
+#   strings    -- UTF-8 JSON of the node ids, names, descriptions and types and the (type, bus_service) pairs
+#
+#   python snapshot.py [path]
+
+MAGIC = b"MAPGRAPH"
+FORMAT = 3
+HEADER = struct.Struct("<8sIiddqqqq")
+
+# name, typecode, whether the section has one entry per node (+ 1 for offsets) or one per edge
+SECTIONS = [("offsets", "q", "offsets"),
+            ("targets", "q", "edges"),
+            ("distances", "d", "edges"),
+            ("codes", "q", "edges"),
+            ("roffsets", "q", "offsets"),
+            ("rsources", "q", "edges"),
+            ("rpositions", "q", "edges"),
+            ("lats", "d", "nodes"),
+            ("longs", "d", "nodes")]
+
+
+def export(graph: CompactGraph, path, version: float = 0.0, signature: tuple = None) -> None:
+    """
+    Write a CompactGraph to a snapshot file. The file is written next to path and renamed over it, so a
+    process that still has the old snapshot mapped keeps reading the old file.
+
+    Arguments:
+        graph     -- CompactGraph object to write
+        path      -- String path of the snapshot file
+        version   -- Database.graph_version of the database the graph was built from, checked by load
+        signature -- Database.signature of the database the graph was built from, checked by load
+
+    Returns:
+        None
+    """
+    if sys.byteorder != "little":
+        raise ValueError("Graph snapshots can only be written on little-endian machines")
+
+    strings = json.dumps({"nodes": [[node.id, node.name, node.description, node.type] for node in graph.nodes],
+                          "services": [list(service) for service in graph.services]}).encode("utf-8")
+
+    columns = {"offsets": graph.offsets,
+               "targets": graph.targets,
+               "distances": graph.distances,
+               "codes": graph.codes,
+               "roffsets": graph.roffsets,
+               "rsources": graph.rsources,
+               "rpositions": graph.rpositions,
+               "lats": [node.lat for node in graph.nodes],
+               "longs": [node.long for node in graph.nodes]}
+
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+
+    with open(temporary, "wb") as file:
+        mtime, size = signature if signature is not None else (0.0, -1)
+        file.write(HEADER.pack(MAGIC, FORMAT, 0, version, mtime, size, len(graph.nodes), len(graph.targets), len(strings)))
+
+        for name, typecode, _ in SECTIONS:
+            file.write(array(typecode, columns[name]).tobytes())
+
+        file.write(strings)
+
+    os.replace(temporary, path)
+
+
+def load(path, version: float = None, signature: tuple = None) -> CompactGraph:
+    """
+    Memory-map a snapshot file as a CompactGraph.
+
+    Arguments:
+        path      -- String path of the snapshot file
+        version   -- graph version of the database, the snapshot is ignored if it was built from another one;
+                     None accepts any snapshot
+        signature -- Database.signature of the database, the snapshot is ignored if the database files changed
+                     since it was built, which catches writes that did not bump the graph version; None skips the check
+
+    Returns:
+        CompactGraph object whose arrays are read-only views of the file,
+        None if the file is missing, unreadable, of another format or out of date
+    """
+    if sys.byteorder != "little" or not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    except (OSError, ValueError):
+        return None
+
+    if len(buffer) < HEADER.size:
+        return None
+
+    magic, format, _, snapshot_version, mtime, size, node_count, edge_count, strings_length = HEADER.unpack_from(buffer, 0)
+
+    if magic != MAGIC or format != FORMAT or (version is not None and snapshot_version != version):
+        return None
+
+    if signature is not None and (mtime, size) != tuple(signature):
+        return None
+
+    counts = {"offsets": node_count + 1, "edges": edge_count, "nodes": node_count}
+
+    if len(buffer) != HEADER.size + 8 * sum(counts[kind] for _, _, kind in SECTIONS) + strings_length:
+        return None
+
+    view = memoryview(buffer)
+    columns = {}
+    position = HEADER.size
+
+    for name, typecode, kind in SECTIONS:
+        end = position + 8 * counts[kind]
+        columns[name] = view[position:end].cast(typecode)
+        position = end
+
+    strings = json.loads(bytes(view[position:position + strings_length]).decode("utf-8"))
+
+    graph = CompactGraph()
+    graph.buffer = buffer
+
+    for index, (id, name, description, type) in enumerate(strings["nodes"]):
+        graph.index[id] = index
+        graph.nodes.append(Node(id=id, name=name, description=description,
+                                lat=columns["lats"][index], long=columns["longs"][index], type=type))
+
+    graph.services = [tuple(service) for service in strings["services"]]
+
+    for name in ("offsets", "targets", "distances", "codes", "roffsets", "rsources", "rpositions"):
+        setattr(graph, name, columns[name])
+
+    return graph
+
+
+def loader(path):
+    """
+    Returns a GraphStore loader that serves the graph from a snapshot file.
+    The snapshot is memory-mapped when it was exported from the current graph version and signature of the database. Otherwise the graph
+    is built from the database, exported to path and then mapped, so the next start or reload is cheap.
+
+    Arguments:
+        path -- String path of the snapshot file
+
+    Returns:
+        Callable taking a Database object and returning a CompactGraph object
+    """
+    def load_graph(database) -> CompactGraph:
+        version, signature = database.graph_version(), database.signature()
+        graph = load(path, version, signature)
+
+        if graph is not None:
+            return graph
+
+        graph = CompactGraph(database.select_adj_list())
+
+        try:
+            export(graph, path, version, signature)
+
+        except (OSError, ValueError) as e:
+            print(e)
+            return graph
+
+        return load(path, version, signature) or graph
+
+    return load_graph
+
+
+if __name__ == "__main__":
+    import db
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "./static/data/map.graph"
+    database = db.Database()
+    graph = CompactGraph(database.select_adj_list())
+    export(graph, path, database.graph_version(), database.signature())
+    print("Saved {} to {}".format(graph, path))
@@ -0,0 +1,186 @@
+from math import cos, radians, floor
+import geo
+
+class GridIndex:
+    """
+    In-memory spatial index over Node objects using a uniform grid of lat/long cells.
+    Each node is stored in the cell its coordinates fall in, so nearest-node and bounding-box queries only
+    look at the cells around the query instead of every node.
+    """
+    # kilometers per degree of latitude
+    KM_PER_DEGREE = 111.19
+
+    def __init__(self, nodes, cell: float = 0.005) -> None:
+        """
+        Constructor for GridIndex object.
+
+        Arguments:
+            nodes -- list of Node objects to index
+            cell  -- size of a grid cell in degrees, 0.005 is roughly 550 meters
+        """
+        self.cell = cell
+        self.cells = {}
+        self.count = 0
+
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def key(self, lat: float, long: float) -> tuple:
+        """
+        Returns the (row, column) of the cell containing a coordinate
+        """
+        return (floor(lat / self.cell), floor(long / self.cell))
+
+    def add(self, node) -> None:
+        """
+        Add a Node object to the index.
+        Cells are replaced rather than modified, so a query running in another thread never sees a cell change under it.
+
+        Returns:
+            None
+        """
+        key = self.key(node.lat, node.long)
+        self.cells[key] = self.cells.get(key, []) + [node]
+        self.count += 1
+
+    def remove(self, node) -> bool:
+        """
+        Remove the Node object with the same id from the index.
+
+        Returns:
+            True if a node was removed, False if it was not in the index
+        """
+        key = self.key(node.lat, node.long)
+
+        for index, other in enumerate(self.cells.get(key, [])):
+            if other.id == node.id:
+                cell = self.cells[key][:index] + self.cells[key][index + 1:]
+                self.count -= 1
+
+                if cell:
+                    self.cells[key] = cell
+                else:
+                    del self.cells[key]
+
+                return True
+
+        return False
+
+    def nearest(self, lat: float, long: float, k: int = 1) -> list:
+        """
+        Find the k nodes closest to a coordinate.
+        Rings of cells around the query are searched outwards until the k-th best distance found is closer
+        than anything the next ring could hold.
+
+        Arguments:
+            lat  -- latitude of the query point
+            long -- longitude of the query point
+            k    -- number of nodes to return
+
+        Returns:
+            List of (Node, distance in kilometers) tuples, nearest first
+        """
+        if self.count == 0 or k < 1:
+            return []
+
+        row, column = self.key(lat, long)
+        found = []
+        ring = 0
+
+        while True:
+            # once the rings cover more cells than are occupied, scoring every node is cheaper
+            if (2 * ring + 1) ** 2 > len(self.cells):
+                found = self.__score(lat, long, [node for nodes in list(self.cells.values()) for node in nodes])
+                found.sort(key=lambda pair: pair[1])
+                return found[:k]
+
+            found.extend(self.__score(lat, long, [node for key in self.__ring(row, column, ring) for node in self.cells.get(key, [])]))
+
+            found.sort(key=lambda pair: pair[1])
+            found = found[:k]
+
+            # anything outside this ring is more than ring cells away in latitude or longitude
+            bound = ring * self.cell * self.KM_PER_DEGREE * cos(radians(min(abs(lat) + (ring + 1) * self.cell, 89.0)))
+
+            if len(found) == k and found[-1][1] <= bound:
+                break
+
+            ring += 1
+
+        return found
+
+    def within(self, lat: float, long: float, radius: float) -> list:
+        """
+        Find every node within a distance of a coordinate.
+        Only the cells overlapping the square around the circle are scored.
+
+        Arguments:
+            lat    -- latitude of the query point
+            long   -- longitude of the query point
+            radius -- distance in kilometers
+
+        Returns:
+            List of (Node, distance in kilometers) tuples, nearest first
+        """
+        lat_span = radius / self.KM_PER_DEGREE
+        long_span = radius / (self.KM_PER_DEGREE * max(cos(radians(min(abs(lat) + lat_span, 89.0))), 1e-6))
+
+        found = [pair for pair in self.__score(lat, long, self.bbox(lat - lat_span, long - long_span, lat + lat_span, long + long_span))
+                 if pair[1] <= radius]
+        found.sort(key=lambda pair: pair[1])
+        return found
+
+    def __score(self, lat: float, long: float, nodes: list) -> list:
+        """
+        Returns (Node, distance) for every node, the distances computed in one vectorized call
+        """
+        if not nodes:
+            return []
+
+        lats, longs = geo.coordinates(nodes)
+        return [(node, float(distance)) for node, distance in zip(nodes, geo.oneToMany(lat, long, lats, longs))]
+
+    def __ring(self, row: int, column: int, ring: int):
+        """
+        Iterate over the cell keys exactly ring cells away from (row, column)
+        """
+        if ring == 0:
+            yield (row, column)
+            return
+
+        for offset in range(-ring, ring + 1):
+            yield (row - ring, column + offset)
+            yield (row + ring, column + offset)
+
+        for offset in range(-ring + 1, ring):
+            yield (row + offset, column - ring)
+            yield (row + offset, column + ring)
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> list:
+        """
+        Find every node inside a bounding box.
+
+        Arguments:
+            south -- smallest latitude
+            west  -- smallest longitude
+            north -- largest latitude
+            east  -- largest longitude
+
+        Returns:
+            List of Node objects inside the box
+        """
+        low_row, low_column = self.key(south, west)
+        high_row, high_column = self.key(north, east)
+        span = (high_row - low_row + 1) * (high_column - low_column + 1)
+
+        # a box larger than the data is cheaper to answer by walking the occupied cells
+        if span > len(self.cells):
+            keys = [key for key in list(self.cells) if low_row <= key[0] <= high_row and low_column <= key[1] <= high_column]
+        else:
+            keys = [(row, column) for row in range(low_row, high_row + 1) for column in range(low_column, high_column + 1)]
+
+        return [node for key in keys for node in self.cells.get(key, [])
+                if south <= node.lat <= north and west <= node.long <= east]
@@ -0,0 +1,200 @@
+import threading
+import time
+from objects import *
+
+class GraphStore:
+    """
+    Process-wide holder for the routing graph.
+    The adjacency list is loaded from the database once and the same graph object is handed out
+    to every request. Callers must treat the graph as read-only.
+
+    The store watches the graph version recorded in the database (Database.graph_version), together with the
+    modification time and size of the database files (Database.signature) for writes made by other programs
+    and a replaced map.db. When either changes, a new graph is built off to the side and swapped in with a
+    single assignment, so a request either sees the old graph or the new one, never a half-built one. Every rebuild bumps the version number.
+
+    Small changes made through update (see editor.py) swap in a changed copy of the graph instead of
+    rebuilding it, and bump the version number the same way.
+
+    Reading the graph version takes a query, so it is checked at most once per interval seconds; a change
+    made to the database by another process is picked up within that time.
+    """
+    def __init__(self, database, factory=Graph, loader=None, interval: float = 1.0) -> None:
+        """
+        Constructor for GraphStore object. Builds the graph immediately.
+
+        Arguments:
+            database -- Database object to load the adjacency list from
+            factory  -- callable that takes the adjacency list rows and returns a graph object
+            loader   -- callable that takes the Database object and returns a graph object, used instead of
+                        factory when the graph does not come from select_adj_list, for example snapshot.loader
+            interval -- seconds between two checks of the graph version of the database
+        """
+        self.database = database
+        self.factory = factory
+        self.loader = loader if loader is not None else lambda database: factory(database.select_adj_list())
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.updaters = []
+        self.interval = interval
+        self.checked = time.monotonic()
+
+        # (version, stamp of the database, graph, artifacts) is always replaced as a whole
+        self.state = (0, None, None, {})
+        self.reload()
+
+    def get(self):
+        """
+        Returns the current graph, rebuilding it first if the database has changed.
+
+        Returns:
+            Graph object shared by all requests
+        """
+        return self.current()[1]
+
+    def current(self) -> tuple:
+        """
+        Returns the current graph together with its version number.
+        Use this instead of reading version and graph separately so both come from the same build.
+
+        Returns:
+            Tuple of (int version, Graph object)
+        """
+        version, stamp, graph, artifacts = self.state
+
+        if self.stale(stamp):
+            self.reload()
+            version, stamp, graph, artifacts = self.state
+
+        return (version, graph)
+
+    @property
+    def version(self) -> int:
+        """
+        Returns the version number of the graph currently being served
+        """
+        return self.current()[0]
+
+    def derived(self, name, builder):
+        """
+        Returns an object computed from the current graph, building it on first use.
+        Derived objects are thrown away whenever the graph is rebuilt.
+
+        Arguments:
+            name    -- string key identifying the derived object
+            builder -- callable that takes the graph and returns the derived object
+
+        Returns:
+            The derived object for the current graph version
+        """
+        self.current()
+        version, stamp, graph, artifacts = self.state
+
+        if name not in artifacts:
+            with self.lock:
+                if name not in artifacts:
+                    artifacts[name] = builder(graph)
+
+        return artifacts[name]
+
+    def onReload(self, callback) -> None:
+        """
+        Register a function to call after every rebuild, used to drop anything computed from the old graph.
+
+        Arguments:
+            callback -- callable that takes the new version number and the new graph
+
+        Returns:
+            None
+        """
+        self.listeners.append(callback)
+
+    def onUpdate(self, callback) -> None:
+        """
+        Register a function to call after every in-memory change made with update, used to drop or carry
+        forward anything computed from the previous version.
+
+        Arguments:
+            callback -- callable that takes the new version number, the new graph, the change returned by
+                        the edit and the dict of derived objects carried over from the previous version,
+                        from which it must remove (or replace) the ones the change made stale
+
+        Returns:
+            None
+        """
+        self.updaters.append(callback)
+
+    def update(self, edit) -> int:
+        """
+        Change the graph without rebuilding it from the database.
+        The edit runs under the store lock, so no reload or other edit happens at the same time, and the
+        graph version it leaves in the database is recorded as the one the new graph belongs to.
+
+        Arguments:
+            edit -- callable that takes the current graph, writes the change to the database and returns
+                    (changed graph, change). It must not modify the graph it is given, requests may still be using it.
+
+        Returns:
+            int version number of the changed graph
+        """
+        with self.lock:
+            # pick up changes made to the database by anyone else first
+            self.reload()
+            version, stamp, graph, artifacts = self.state
+
+            graph, change = edit(graph)
+            artifacts = dict(artifacts)
+
+            for callback in self.updaters:
+                callback(version + 1, graph, change, artifacts)
+
+            self.state = (version + 1, self.stamp(), graph, artifacts)
+
+        return version + 1
+
+    def reload(self) -> None:
+        """
+        Rebuild the graph from the database and swap it in.
+        Only one thread rebuilds at a time; the others return at once and keep serving the old graph until
+        the swap. Only the first load, when there is no graph to serve yet, waits for the rebuild.
+
+        Returns:
+            None
+        """
+        if not self.lock.acquire(blocking=self.state[2] is None):
+            return
+
+        try:
+            stamp = self.stamp()
+            version, old_stamp, graph, artifacts = self.state
+
+            # another thread already rebuilt the graph for this graph version
+            if graph is not None and stamp == old_stamp:
+                return
+
+            graph = self.loader(self.database)
+            self.state = (version + 1, stamp, graph, {})
+
+            for callback in self.listeners:
+                callback(version + 1, graph)
+
+        finally:
+            self.lock.release()
+
+    def stale(self, stamp) -> bool:
+        """
+        Returns True if the stamp of the database is no longer stamp, reading it at most once per interval
+        """
+        now = time.monotonic()
+
+        if now - self.checked < self.interval:
+            return False
+
+        self.checked = now
+        return self.stamp() != stamp
+
+    def stamp(self):
+        """
+        Returns the graph version and the signature of the database, one of which changes whenever its nodes or edges do
+        """
+        return (self.database.graph_version(), self.database.signature())
@@ -0,0 +1,124 @@
+import sys
+import argparse
+from objects import *
+from spatial import GridIndex
+import db
+
+# Offline pipeline that generates the Walk edges and the nearby_bus_stops table from the nodes table.
+# Every origin node is linked to the closest nodes of the destination type within walking distance. The
+# candidates come from a GridIndex, so each origin only scores the few cells around it instead of every node.
+#
+#   python walk.py [--database ./static/data/map.db] [--radius 0.85] [--dry-run]
+
+# origin type, destination type, maximum stops per origin, whether the walk is added in both directions
+RULES = [("HDB Block", "Bus Stop", 4, False),
+         ("Mrt Station", "Bus Stop", 2, True)]
+
+# nearby_bus_stops lists the bus stops of the walk edges leaving these node types
+NEARBY_TYPES = {"HDB Block", "Mrt Station"}
+
+# rows passed to each executemany call, all batches are written in one transaction
+BATCH = 10000
+
+
+def walkEdges(nodes: list, radius: float, rules: list = RULES) -> list:
+    """
+    Generate walk edges between nearby nodes.
+
+    Arguments:
+        nodes  -- list of Node objects
+        radius -- longest walk in kilometers
+        rules  -- list of (origin type, destination type, limit, both directions) tuples
+
+    Returns:
+        List of dicts with source, destination, distance, bus_service and type, ready for insert_many
+    """
+    edges = []
+    seen = set()
+
+    for origin_type, destination_type, limit, both in rules:
+        index = GridIndex([node for node in nodes if node.type == destination_type])
+
+        for origin in (node for node in nodes if node.type == origin_type):
+            for destination, distance in index.within(origin.lat, origin.long, radius)[:limit]:
+                if destination.id == origin.id:
+                    continue
+
+                pairs = [(origin, destination), (destination, origin)] if both else [(origin, destination)]
+
+                for source, target in pairs:
+                    if (source.id, target.id) not in seen:
+                        seen.add((source.id, target.id))
+                        edges.append({"source": source.id,
+                                      "destination": target.id,
+                                      "distance": round(distance, 2),
+                                      "bus_service": "0",
+                                      "type": "Walk"})
+
+    return edges
+
+
+def nearbyBusStops(nodes: list, edges: list) -> list:
+    """
+    Returns the nearby_bus_stops rows for the walk edges leaving nodes of the NEARBY_TYPES.
+
+    Arguments:
+        nodes -- list of Node objects
+        edges -- list of walk edge dicts returned by walkEdges
+
+    Returns:
+        List of dicts with source and bus_stop_code, ready for insert_many
+    """
+    types = {node.id: node.type for node in nodes}
+
+    return [{"source": edge["source"], "bus_stop_code": edge["destination"]} for edge in edges
+            if types.get(edge["source"]) in NEARBY_TYPES and types.get(edge["destination"]) == "Bus Stop"]
+
+
+def write(database: db.Database, edges: list, nearby: list) -> None:
+    """
+    Replace the Walk edges and the nearby_bus_stops table with the generated rows.
+    Everything is written in one transaction, so a failure leaves the old rows in place and a running
+    server never sees the tables without walk edges.
+
+    Arguments:
+        database -- Database object to write to
+        edges    -- list of walk edge dicts
+        nearby   -- list of nearby_bus_stops dicts
+
+    Returns:
+        None
+    """
+    with database.transaction() as conn:
+        conn.execute("DELETE FROM edge WHERE type = 'Walk'")
+        conn.execute("DELETE FROM nearby_bus_stops")
+
+        for start in range(0, len(edges), BATCH):
+            conn.executemany('''INSERT INTO edge (source, destination, distance, bus_service, type)
+                                VALUES (:source, :destination, :distance, :bus_service, :type)''', edges[start:start + BATCH])
+
+        for start in range(0, len(nearby), BATCH):
+            conn.executemany('''INSERT INTO nearby_bus_stops (source, bus_stop_code)
+                                VALUES (:source, :bus_stop_code)''', nearby[start:start + BATCH])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Walk edges and nearby_bus_stops from the nodes table")
+    parser.add_argument("--database", default="./static/data/map.db", help="path to the sqlite3 database")
+    parser.add_argument("--radius", type=float, default=0.85, help="longest walk in kilometers")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be written")
+    arguments = parser.parse_args()
+
+    database = db.Database(arguments.database)
+    nodes = [Node(data=row) for row in database.select_many("SELECT * FROM nodes")]
+
+    edges = walkEdges(nodes, arguments.radius)
+    nearby = nearbyBusStops(nodes, edges)
+
+    print("Generated {} walk edges and {} nearby bus stops from {} nodes".format(len(edges), len(nearby), len(nodes)))
+
+    if arguments.dry_run:
+        sys.exit()
+
+    write(database, edges, nearby)
+    print("Written to {}".format(arguments.database))